@@ -2,19 +2,141 @@
 # app.py
 # -----------------------------------------------------------------------------
 # Streamlit dashboard entry point for exploring Farey-based fractals.
+#
+# Start with FAREY_WARMUP=1 to compute the default views (both origins) in
+# the background from the first run of the app in a server process, so the
+# page views that follow a deploy are served from the cache. Heavy libraries
+# (matplotlib, SciPy) are only imported once a computation needs them.
 # 
 # Author: Daniel Cottrell
 # Part of the Farey fractal project.
 # -----------------------------------------------------------------------------
 
+import os
 import warnings
+from concurrent.futures import CancelledError
 import streamlit as st
-from src import fractal_corner, fractal_centre, intersect, plotting, metrics
+from src import cache, incremental, instrument, intersect, jobs, katz_index, plotting, metrics, store, tiles
+
+# Views computed by the warm-up: (N, K, origin) at the default point size
+WARMUP_VIEWS = ((257, 0.1, "Corner"), (257, 0.1, "Centre"))
+WARMUP_POINT_SIZE = 0.5
 
 warnings.filterwarnings("ignore")
 st.set_option('client.showErrorDetails', False)
 
 st.set_page_config(page_title="Farey Fractals", layout="wide")
+
+# Results shared across reruns and sessions, keyed by canonical parameters,
+# backed by the on-disk store so they also survive restarts
+results = cache.shared_cache()
+disk = store.shared_store()
+
+# Stages run for this page are recorded only while the Performance panel's
+# toggle is on; background jobs report here too
+instrument.stop_collecting()
+perf_records = instrument.start_collecting() if st.session_state.get("perf") else None
+
+def fractal_key(panel, N, K, origin):
+    """Cache key and incremental builder for a panel's fractal.
+
+    K is canonicalised to the number of index points it selects, so every K
+    between two breakpoints shares one key. The builder lives in the
+    session and is reused while only K changes.
+    """
+    builder = st.session_state.get(f"_builder_{panel}")
+    if builder is None or builder.N != N or builder.origin != origin.lower():
+        builder = incremental.IncrementalFractal(N, origin)
+        st.session_state[f"_builder_{panel}"] = builder
+
+    return (N, builder.origin, builder.index.count(K)), builder
+
+def fractal_grid(key, builder, K):
+    """Cached grid for a fractal key, updating the panel's builder in place on a miss."""
+    def build():
+        with builder.lock:
+            if disk is None:
+                return builder.set_K(K)
+            return disk.load_or_build(key[0], K, key[1], builder).grid
+
+    return results.get_or_compute(("grid",) + key, build)
+
+def fractal_panel(key, builder, K, point_size, inverse):
+    """Grid, PNG rendering and dimension (None when empty) of one panel."""
+    grid = fractal_grid(key, builder, K)
+    png = fractal_figure(key, grid, key[0], K, point_size, key[1], inverse)
+    dimension = fractal_dimension(key, grid, K) if grid.count() else None
+    return grid, png, dimension
+
+def completed(futures):
+    """(future, result) pairs of background jobs in the order they finish.
+
+    Waiting touches the session state between polls, so a rerun triggered
+    by a newer widget change interrupts this one; a job superseded in the
+    meantime stops the run.
+    """
+    for future in jobs.as_completed(futures, lambda: st.session_state.get("_jobs")):
+        try:
+            yield future, future.result()
+        except (jobs.Stale, CancelledError):
+            st.stop()
+
+def large_fractal_pyramid(N, K, origin):
+    """Cache key and tile pyramid for a fractal too large to draw whole.
+
+    The grid is built straight from the Katz index rather than through an
+    incremental builder, whose per-cell coverage counts would not fit.
+    """
+    index = katz_index.get_index(N, origin)
+    key = (N, index.origin, index.count(K))
+    # Only the pyramid is cached: its size already includes the grid it holds
+    return key, results.get_or_compute(
+        ("pyramid",) + key, lambda: tiles.TilePyramid(index.generate_fractal_grid(K), mode="count"))
+
+def tiled_figure(key, pyramid, window, inverse):
+    """Cached PNG rendering of one window of a tiled fractal."""
+    return results.get_or_compute(
+        ("tiles", key, window, inverse),
+        lambda: plotting.figure_png(plotting.plot_tiles(pyramid, *window, inverse=inverse))
+    )
+
+def fractal_dimension(key, grid, K):
+    """Cached box-counting dimension of a fractal."""
+    def compute():
+        if disk is None:
+            return metrics.fractal_dimension(grid)
+        return disk.dimension(key[0], K, key[1])
+
+    return results.get_or_compute(("dimension",) + key, compute)
+
+def fractal_figure(key, grid, N, K, point_size, origin, inverse):
+    """Cached PNG rendering of a single fractal."""
+    return results.get_or_compute(
+        ("figure", key, point_size, inverse),
+        lambda: plotting.figure_png(plotting.plot_fractal(grid, N, K, point_size, origin, inverse=inverse))
+    )
+
+def performance_table(records):
+    """Rows of the Performance panel, one per recorded stage."""
+    return [{
+        "Stage": record["stage"],
+        "Time (ms)": round(record["seconds"] * 1e3, 2),
+        "Points": record.get("points"),
+        "Peak (MB)": round(record["peak_bytes"] / 2**20, 2) if "peak_bytes" in record else None,
+        "Parameters": ", ".join(f"{name}={record[name]}" for name in ("origin", "N", "K") if name in record),
+        "Thread": record["thread"],
+    } for record in records]
+
+def warm_up():
+    """Compute the grid, rendering and dimension of each warm-up view into the shared cache."""
+    for N, K, origin in WARMUP_VIEWS:
+        builder = incremental.IncrementalFractal(N, origin)
+        key = (N, builder.origin, builder.index.count(K))
+        fractal_panel(key, builder, K, WARMUP_POINT_SIZE, False)
+
+if os.environ.get("FAREY_WARMUP"):
+    jobs.run_once("warm_up", warm_up)
+
 st.markdown(
     """
     <div style='
@@ -56,20 +178,39 @@ if mode == "Single Fractal":
     left_col, _, right_col = st.columns([2, 0.2, 2])
 
     with left_col:
-        N = st.slider("Order (N)",
-                       50, 1000, 257, 1,
-                       help="Sets the Farey sequence order. Higher values increase detail and complexity of the fractal."
-                       )
+        tiled = st.checkbox("Large N (Tiled View)",
+                            value=False,
+                            help="Explore orders beyond 1000 by zooming and panning over a multi-resolution view.")
+
+        if tiled:
+            N = st.number_input("Order (N)",
+                                50, 50000, 5000, 1,
+                                help="Sets the Farey sequence order. Large orders take a few seconds to generate the first time."
+                                )
+        else:
+            N = st.slider("Order (N)",
+                           50, 1000, 257, 1,
+                           help="Sets the Farey sequence order. Higher values increase detail and complexity of the fractal."
+                           )
         
         K = st.slider("Katz criterion (K)",
                       K_min, K_max, 0.1, 0.01,
                       help="Controls how many points satisfy the selection threshold."
                       )
         
-        point_size = st.slider("Point Size",
-                               0.1, 5.0, 0.5, 0.1,
-                               help="Adjusts the rendered point size in the fractal plots."
-                               )
+        if tiled:
+            zoom = st.select_slider("Zoom",
+                                    [2**z for z in range(8)], 1,
+                                    format_func=lambda z: f"{z}x",
+                                    help="Magnification of the view; each step halves the visible width."
+                                    )
+            centre_x = st.slider("Centre X", 0, N - 1, N // 2, help="Horizontal position of the view centre.")
+            centre_y = st.slider("Centre Y", 0, N - 1, N // 2, help="Vertical position of the view centre.")
+        else:
+            point_size = st.slider("Point Size",
+                                   0.1, 5.0, 0.5, 0.1,
+                                   help="Adjusts the rendered point size in the fractal plots."
+                                   )
 
         origin_choice = st.radio(
             "Fractal Origin",
@@ -83,19 +224,29 @@ if mode == "Single Fractal":
                               value=False,
                               help="Swaps black and white to highlight complementary patterns.")
 
-        if origin_choice == "Corner":
-            points = fractal_corner.generate_fractal_points(N, K)
+        if tiled:
+            key, pyramid = large_fractal_pyramid(N, K, origin_choice)
         else:
-            points = fractal_centre.generate_fractal_points(N, K)
+            key, builder = fractal_key("single", N, K, origin_choice)
+            grid = fractal_grid(key, builder, K)
 
     with right_col:
-        fig = plotting.plot_fractal(points, N, K, point_size, origin_choice.lower(), inverse=inverse)
-        st.pyplot(fig)
+        if tiled:
+            # Window of width N / zoom around the chosen centre, kept inside the grid
+            width = max(N // zoom, 1)
+            x0 = min(max(centre_x - width // 2, 0), N - width)
+            y0 = min(max(centre_y - width // 2, 0), N - width)
+            st.image(tiled_figure(key, pyramid, (x0, x0 + width, y0, y0 + width), inverse),
+                     width="stretch")
+            st.caption("Shading shows the fraction of occupied cells under each pixel.")
+        else:
+            st.image(fractal_figure(key, grid, N, K, point_size, origin_choice.lower(), inverse),
+                     width="stretch")
 
-        if points:
-            st.write("**Metrics**")
-            dim = metrics.fractal_dimension(points)
-            st.text(f"Dimension = {dim:.3f}")
+            if grid.count():
+                st.write("**Metrics**")
+                dim = fractal_dimension(key, grid, K)
+                st.text(f"Dimension = {dim:.3f}")
 
 else:  # Dual Fractals
     st.subheader("Synchronisation Options")
@@ -106,6 +257,10 @@ else:  # Dual Fractals
 
     col1, col2 = st.columns(2)
 
+    # Panels and comparisons are computed in the background and drawn into
+    # these placeholders as each one finishes
+    session_jobs = st.session_state.setdefault("_jobs", jobs.JobSlots())
+
     # ---- FRACTAL A ----
     with col1:
         st.subheader("Fractal A")
@@ -118,23 +273,16 @@ else:  # Dual Fractals
         origin_choice1 = st.radio("Fractal Origin (A)", ["Corner", "Centre"], index=0,
                                   horizontal=True, key="o1",
                                   help="Choose the construction origin for Fractal A.")
-        inverse = st.checkbox("Invert Mapping", value=False, key="i1",
-                              help="Swaps black and white to highlight complementary patterns.")
+        inverse1 = st.checkbox("Invert Mapping", value=False, key="i1",
+                               help="Swaps black and white to highlight complementary patterns.")
 
-        if origin_choice1 == "Corner":
-            points1 = fractal_corner.generate_fractal_points(N1, K1)
-        else:
-            points1 = fractal_centre.generate_fractal_points(N1, K1)
+        key1, builder1 = fractal_key("A", N1, K1, origin_choice1)
 
         st.write("")
         st.write("")
 
-        fig1 = plotting.plot_fractal(points1, N1, K1, point_size1, origin_choice1.lower(), inverse=inverse)
-        st.pyplot(fig1)
-
-        if points1:
-            st.write("**Metrics (A):**")
-            st.text(f"Dimension = {metrics.fractal_dimension(points1):.3f}")
+        panel_a = st.empty()
+        panel_a.info("Computing Fractal A…")
 
     # ---- FRACTAL B ----
     with col2:
@@ -179,30 +327,20 @@ else:  # Dual Fractals
                                       horizontal=True, key="o2",
                                       help="Choose the construction origin for Fractal B.")
 
-        inverse = st.checkbox("Invert Mapping", value=False,
-                              help="Swaps black and white to highlight complementary patterns.")
+        inverse2 = st.checkbox("Invert Mapping", value=False,
+                               help="Swaps black and white to highlight complementary patterns.")
 
 
-        if origin_choice2 == "Corner":
-            points2 = fractal_corner.generate_fractal_points(N2, K2)
-        else:
-            points2 = fractal_centre.generate_fractal_points(N2, K2)
+        key2, builder2 = fractal_key("B", N2, K2, origin_choice2)
 
         st.write("")
         st.write("")
 
-        fig2 = plotting.plot_fractal(points2, N2, K2, point_size2, origin_choice2.lower(), inverse=inverse)
-        st.pyplot(fig2)
-
-        if points2:
-            st.write("**Metrics (B):**")
-            st.text(f"Dimension = {metrics.fractal_dimension(points2):.3f}")
+        panel_b = st.empty()
+        panel_b.info("Computing Fractal B…")
 
     st.write("")
-    if N1 != N2:
-        st.write("Hausdorff Distance is only calculated when N are the same size.")
-    else:
-        st.text(f"Hausdorff Distance (A and B) = {metrics.fractal_distance(points1, points2):.3f}")
+    distance_slot = st.empty()
     
     st.write("")
     st.write("")
@@ -210,20 +348,7 @@ else:  # Dual Fractals
 
     # ---- COMBINED OVERLAY ----
     st.subheader("Overlay of Fractal A and B", help="Visual comparison of both fractals plotted together.")
-    import matplotlib.pyplot as plt
-    fig_overlay, ax = plt.subplots(figsize=(8, 8))
-
-    if points1:
-        x1, y1 = zip(*points1)
-        ax.scatter(x1, y1, s=point_size1, c="red", label="Fractal A", alpha=0.6)
-    if points2:
-        x2, y2 = zip(*points2)
-        ax.scatter(x2, y2, s=point_size2, c="blue", label="Fractal B", alpha=0.6)
-
-    ax.set_aspect("equal")
-    ax.legend()
-
-    st.pyplot(fig_overlay)
+    overlay_slot = st.empty()
 
     st.write("")
     st.write("")
@@ -231,34 +356,70 @@ else:  # Dual Fractals
     # ---- FRACTAL INTERSECTION ----
     st.subheader("Intersection of Fractal A and B", help="Shows overlapping points shared by both fractals.")
 
-    intersection_pts = intersect.intersect_points(points1, points2, tol=1)
-
-    fig_inter, ax = plt.subplots(figsize=(8, 8))
-    if intersection_pts:
-        x_int, y_int = zip(*intersection_pts)
-        ax.scatter(x_int, y_int, s=min(point_size1, point_size2),
-                   c="purple")
-    ax.set_aspect("equal")
-
-    st.pyplot(fig_inter)
+    radius = st.slider("Match Radius", 0.0, 5.0, 0.0, 0.5,
+                       help="Points of Fractal A within this distance of a point of Fractal B count as shared. Zero requires an exact match.")
+    intersection_slot = st.empty()
 
     st.write("")
     st.write("")
 
     # ---- FRACTAL DIFFERENCE (A - B) ----
     st.subheader("Difference: Fractal A − Fractal B", help="Displays points unique to Fractal A. If Fractal A has no unique points relative to Fractal B, this appears empty.")
-
-    difference_pts = intersect.difference_points(points1, points2, tol=1)
-
-    fig_diff, ax = plt.subplots(figsize=(8, 8))
-    if difference_pts:
-        x_diff, y_diff = zip(*difference_pts)
-        ax.scatter(x_diff, y_diff, s=point_size1,
-                   c="green")
-    
-    ax.set_aspect("equal")
-    st.pyplot(fig_diff)
-
-
-
-
+    difference_slot = st.empty()
+
+    # ---- BACKGROUND COMPUTATION ----
+    panels = {
+        session_jobs.submit("A", (key1, point_size1, inverse1),
+                            lambda: fractal_panel(key1, builder1, K1, point_size1, inverse1)): ("A", panel_a),
+        session_jobs.submit("B", (key2, point_size2, inverse2),
+                            lambda: fractal_panel(key2, builder2, K2, point_size2, inverse2)): ("B", panel_b),
+    }
+    grids = {}
+    for future, (grid, png, dimension) in completed(panels):
+        name, slot = panels[future]
+        grids[name] = grid
+        with slot.container():
+            st.image(png, width="stretch")
+            if dimension is not None:
+                st.write(f"**Metrics ({name}):**")
+                st.text(f"Dimension = {dimension:.3f}")
+    grid1, grid2 = grids["A"], grids["B"]
+
+    # Each comparison job maps to the function that draws its result
+    draw_image = lambda slot: (lambda png: slot.image(png, width="stretch"))
+    comparisons = {
+        session_jobs.submit("overlay", (key1, key2, point_size1, point_size2), lambda: results.get_or_compute(
+            ("overlay", key1, key2, point_size1, point_size2),
+            lambda: plotting.figure_png(plotting.plot_overlay(grid1, grid2, point_size1, point_size2))
+        )): draw_image(overlay_slot),
+        session_jobs.submit("intersection", (key1, key2, radius, min(point_size1, point_size2)), lambda: results.get_or_compute(
+            ("intersection", key1, key2, radius, min(point_size1, point_size2)),
+            lambda: plotting.figure_png(plotting.plot_points(
+                intersect.intersect_points(grid1, grid2, tol=1, radius=radius), min(point_size1, point_size2), "purple"))
+        )): draw_image(intersection_slot),
+        session_jobs.submit("difference", (key1, key2, radius, point_size1), lambda: results.get_or_compute(
+            ("difference", key1, key2, radius, point_size1),
+            lambda: plotting.figure_png(plotting.plot_points(
+                intersect.difference_points(grid1, grid2, tol=1, radius=radius), point_size1, "green"))
+        )): draw_image(difference_slot),
+    }
+    if N1 != N2:
+        distance_slot.write("Hausdorff Distance is only calculated when N are the same size.")
+    else:
+        comparisons[session_jobs.submit("distance", tuple(sorted((key1, key2))), lambda: results.get_or_compute(
+            ("distance",) + tuple(sorted((key1, key2))),
+            lambda: metrics.fractal_distance(grid1, grid2)
+        ))] = lambda distance: distance_slot.text(f"Hausdorff Distance (A and B) = {distance:.3f}")
+
+    for future, value in completed(comparisons):
+        comparisons[future](value)
+
+st.write("")
+with st.expander("Performance"):
+    st.checkbox("Record Stage Timings", key="perf",
+                help="Times every generation, metric and plotting stage run for this page. Start the app with FAREY_PERF=memory to also trace allocation peaks.")
+    if perf_records:
+        st.dataframe(performance_table(perf_records), width="stretch", hide_index=True)
+        st.caption(f"{len(perf_records)} stages, {sum(record['seconds'] for record in perf_records):.3f} s in total.")
+    elif perf_records is not None:
+        st.caption("No stages ran; every result came from the cache.")
@@ -0,0 +1,254 @@
+# -----------------------------------------------------------------------------
+# backends.py
+# -----------------------------------------------------------------------------
+# Registry of compute-kernel backends for the hot integer loops:
+#   - mirror_plane:   reflect grid points into all quadrants (generate_full_plane)
+#   - katz_mask:      squared-norm test of the Katz criterion
+#   - trace_lines:    cells of one period of each periodic line
+#   - fill_lines:     write periodic lines straight into an occupancy mask
+#   - cover_lines:    add periodic lines to a per-cell coverage count
+#   - pyramid_counts: occupied boxes at every level of an OR-pooled pyramid
+#
+# The "numpy" backend is always available. The "numba" backend compiles the
+# same kernels with Numba (kernels_numba.py) when it is installed; its line
+# kernels step along each line and write cells as they go, without building
+# index arrays.
+# Backends are loaded on first use and chosen with configure() or the
+# FAREY_BACKEND environment variable ("auto" picks the fastest installed).
+# verify() checks that every available backend matches the NumPy one.
+#
+# Author: Daniel Cottrell
+# Part of the Farey fractal project.
+# -----------------------------------------------------------------------------
+
+import os
+import threading
+import numpy as np
+from src import lines
+
+# Preference order used by "auto"
+PREFERENCE = ("numba", "numpy")
+
+# Approximate number of cells the NumPy backend maps at once when filling
+CHUNK_CELLS = 2**24
+
+KERNELS = ("mirror_plane", "katz_mask", "trace_lines", "fill_lines", "cover_lines", "pyramid_counts")
+
+class Backend:
+    """A named set of compute kernels."""
+
+    def __init__(self, name, **kernels):
+        missing = set(KERNELS) - set(kernels)
+        if missing:
+            raise ValueError(f"Backend {name!r} lacks kernels: {sorted(missing)}")
+        self.name = name
+        for kernel in KERNELS:
+            setattr(self, kernel, kernels[kernel])
+
+    def __repr__(self):
+        return f"Backend({self.name!r})"
+
+_loaders = {}
+_loaded = {}
+_configured = os.environ.get("FAREY_BACKEND", "auto")
+_lock = threading.Lock()
+
+def register(name, loader):
+    """Register a backend built by loader() on first use; loader raises ImportError when unavailable."""
+    with _lock:
+        _loaders[name] = loader
+        _loaded.pop(name, None)
+
+def load(name):
+    """The backend registered as name, raising ImportError if it cannot be loaded."""
+    with _lock:
+        if name not in _loaded:
+            if name not in _loaders:
+                raise ValueError(f"Unknown backend: {name!r}")
+            try:
+                _loaded[name] = _loaders[name]()
+            except ImportError as e:
+                _loaded[name] = e
+        backend = _loaded[name]
+    if isinstance(backend, ImportError):
+        raise ImportError(f"Backend {name!r} is not available: {backend}") from backend
+    return backend
+
+def available():
+    """Names of the registered backends that load."""
+    names = []
+    for name in list(_loaders):
+        try:
+            load(name)
+        except ImportError:
+            continue
+        names.append(name)
+    return names
+
+def configure(name):
+    """Select the backend used by current(): a registered name or "auto"."""
+    global _configured
+    if name != "auto":
+        load(name)
+    _configured = name
+
+def current():
+    """The configured backend, or the first available one in PREFERENCE for "auto"."""
+    if _configured != "auto":
+        return load(_configured)
+    for name in PREFERENCE:
+        try:
+            return load(name)
+        except ImportError:
+            continue
+    return load("numpy")
+
+# NumPy backend
+
+def _numpy_mirror_plane(grid_points, reflections, N, offset=0):
+    grid = np.asarray(grid_points, dtype=np.int64).reshape(-1, 2)
+    full_points = (grid[:, None, :] * reflections[None, :, :]).reshape(-1, 2)
+    return (full_points + offset) % N
+
+def _numpy_katz_mask(points, limit):
+    wide = points.astype(np.int64) if points.dtype.kind in "iu" else points
+    sqd = wide[:, 0]**2 + wide[:, 1]**2
+    return sqd <= limit
+
+def _numpy_fill_lines(mask, points, periods, N, offset=0):
+    flat = mask.reshape(-1)
+    _chunked_cells(points, periods, N, offset, lambda cells: flat.__setitem__(cells, True))
+
+def _numpy_cover_lines(coverage, points, periods, N, offset=0, delta=1):
+    flat = coverage.reshape(-1)
+
+    def add(cells):
+        if len(cells) > flat.size // 16:
+            # Large steps: one dense histogram beats scattered updates
+            flat[:] += delta * np.bincount(cells, minlength=flat.size).astype(flat.dtype)
+        else:
+            np.add.at(flat, cells, delta)
+
+    _chunked_cells(points, periods, N, offset, add)
+
+def _numpy_pyramid_counts(mask, levels):
+    level = np.asarray(mask, dtype=bool)
+    counts = [int(np.count_nonzero(level))]
+    for _ in range(levels):
+        # Pad to even sides so every box has four children
+        level = np.pad(level, ((0, level.shape[0] % 2), (0, level.shape[1] % 2)))
+        level = level[0::2, 0::2] | level[1::2, 0::2] | level[0::2, 1::2] | level[1::2, 1::2]
+        counts.append(int(np.count_nonzero(level)))
+    return counts
+
+def _chunked_cells(points, periods, N, offset, consume):
+    """Pass flat cell indices of the lines to consume, about CHUNK_CELLS at a time."""
+    pts = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+    periods = np.asarray(periods, dtype=np.int64)
+    chunk = max(1, CHUNK_CELLS // max(N, 1))
+    for start in range(0, len(pts), chunk):
+        cells = lines.trace_lines(pts[start:start + chunk], periods[start:start + chunk], N, offset)
+        consume(cells[:, 0].astype(np.int64) * N + cells[:, 1])
+
+def _load_numpy():
+    return Backend(
+        "numpy",
+        mirror_plane=_numpy_mirror_plane,
+        katz_mask=_numpy_katz_mask,
+        trace_lines=lines.trace_lines,
+        fill_lines=_numpy_fill_lines,
+        cover_lines=_numpy_cover_lines,
+        pyramid_counts=_numpy_pyramid_counts,
+    )
+
+# Numba backend
+
+def _load_numba():
+    from src import kernels_numba as kernels
+
+    def directions(points, periods, N):
+        pts = np.asarray(points, dtype=np.int64).reshape(-1, 2) % N
+        return pts, np.asarray(periods, dtype=np.int64)
+
+    def mirror_plane(grid_points, reflections, N, offset=0):
+        grid = np.ascontiguousarray(np.asarray(grid_points, dtype=np.int64).reshape(-1, 2))
+        return kernels.mirror_plane(grid, np.ascontiguousarray(reflections, dtype=np.int64), N, offset)
+
+    def katz_mask(points, limit):
+        if points.dtype.kind not in "iu":
+            return _numpy_katz_mask(points, limit)
+        return kernels.katz_mask(np.ascontiguousarray(points, dtype=np.int64), np.float64(limit))
+
+    def trace_lines(points, periods, N, offset=0):
+        pts, periods = directions(points, periods, N)
+        # Emit lines grouped by period, in the NumPy backend's order
+        order = np.argsort(periods, kind="stable")
+        return kernels.trace_lines(np.ascontiguousarray(pts[order]), np.ascontiguousarray(periods[order]), N, offset)
+
+    def fill_lines(mask, points, periods, N, offset=0):
+        kernels.fill_lines(mask, *directions(points, periods, N), N, offset)
+
+    def cover_lines(coverage, points, periods, N, offset=0, delta=1):
+        kernels.cover_lines(coverage, *directions(points, periods, N), N, offset, coverage.dtype.type(delta))
+
+    def pyramid_counts(mask, levels):
+        return [int(count) for count in kernels.pyramid_counts(np.ascontiguousarray(mask, dtype=bool), levels)]
+
+    return Backend(
+        "numba",
+        mirror_plane=mirror_plane,
+        katz_mask=katz_mask,
+        trace_lines=trace_lines,
+        fill_lines=fill_lines,
+        cover_lines=cover_lines,
+        pyramid_counts=pyramid_counts,
+    )
+
+register("numpy", _load_numpy)
+register("numba", _load_numba)
+
+# Verification
+
+VERIFY_N_VALUES = (1, 2, 50, 64, 101, 257)
+
+def verify(names=None, N_values=VERIFY_N_VALUES, seed=0):
+    """(backend, kernel, N) for every output that differs from the NumPy backend's.
+
+    Compares every available backend (or those named) on random directions,
+    including the axis directions, at both the corner and centre offsets.
+    """
+    reference = load("numpy")
+    names = [name for name in (names or available()) if name != "numpy"]
+    reflections = np.array([(1, 1), (1, -1), (-1, 1), (-1, -1)], dtype=np.int64)
+    rng = np.random.default_rng(seed)
+
+    mismatches = []
+    for name in names:
+        backend = load(name)
+        for N in N_values:
+            points = np.concatenate([rng.integers(0, N, (40, 2)), [(0, 1), (1, 0), (0, 0)]]) % N
+            directions, periods = lines.distinct_lines(points, N)
+            limit = np.float64(N - 1) * 0.5
+            mask = rng.random((N, N)) < 0.05
+
+            def run(kernels, offset):
+                grid = np.zeros((N, N), dtype=bool)
+                kernels.fill_lines(grid, directions, periods, N, offset)
+                coverage = np.zeros((N, N), dtype=np.int32)
+                kernels.cover_lines(coverage, points, lines.line_keys(points, N)[1], N, offset, 2)
+                return {
+                    "mirror_plane": kernels.mirror_plane(points, reflections, N, offset),
+                    "katz_mask": kernels.katz_mask(points, limit**2),
+                    "katz_mask_float": kernels.katz_mask(points + 0.5, limit**2),
+                    "trace_lines": kernels.trace_lines(directions, periods, N, offset),
+                    "fill_lines": grid,
+                    "cover_lines": coverage,
+                    "pyramid_counts": np.array(kernels.pyramid_counts(mask, 10)),
+                }
+
+            for offset in (0, N // 2):
+                expected, actual = run(reference, offset), run(backend, offset)
+                for kernel in expected:
+                    if not np.array_equal(expected[kernel], actual[kernel]) and (name, kernel, N) not in mismatches:
+                        mismatches.append((name, kernel, N))
+    return mismatches
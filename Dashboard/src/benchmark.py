@@ -0,0 +1,416 @@
+# -----------------------------------------------------------------------------
+# benchmark.py
+# -----------------------------------------------------------------------------
+# Benchmark suite for every stage of the fractal pipelines.
+#
+# Each stage (Farey generation, grid mapping, mirroring, sorting, Katz
+# selection, line mapping, gridding, box-counting, Hausdorff distance and set
+# operations) is timed in isolation over repeated runs and profiled once
+# under tracemalloc for its peak allocation, across a grid of N, K and both
+# origins. Results can be saved as a baseline JSON file and later runs
+# compared against it, failing when a stage slows down or grows past the
+# regression thresholds.
+#
+# Batch throughput of the discrete periodic Radon projections (radon.py) is
+# measured against a loop projecting one image along one direction at a time.
+# Multi-process generation (parallel.py) is timed against the single-process
+# path for both origins.
+#
+# Outputs are also checked against the reference implementations in
+# "Fractal Visualisation/test.py" (corner) and "test_2.py" (centre). Only
+# their imports and function definitions are loaded, so their plotting code
+# never runs. Every available compute backend is checked against the NumPy
+# one with backends.verify(), the Katz index breakpoints are checked to
+# be the smallest K giving each selection, and the set operations on grids
+# are checked against the same operations on point arrays.
+#
+# Usage:
+#   python -m src.benchmark --quick
+#   python -m src.benchmark --save baseline.json
+#   python -m src.benchmark --baseline baseline.json
+#   python -m src.benchmark --check-only
+#   python -m src.benchmark --radon 64
+#   python -m src.benchmark --workers 4
+#
+# Author: Daniel Cottrell
+# Part of the Farey fractal project.
+# -----------------------------------------------------------------------------
+
+import argparse
+import ast
+import json
+import os
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+import numpy as np
+from src import backends, criteria, farey, fractal_centre, fractal_corner, intersect, katz_index, metrics, radon
+from src.grid import FractalGrid
+
+N_VALUES = (50, 257, 1000, 5000, 10000)
+K_VALUES = (0.1, 0.25, 0.5)
+QUICK_N_VALUES = (50, 257, 1000)
+ORIGINS = ("corner", "centre")
+REPEAT = 5
+
+# Cases whose fractal has more cells than this are skipped
+MAX_CELLS = 5 * 10**7
+
+# A stage regresses when its median time or peak memory grows by more than
+# these ratios, ignoring changes below the noise floors
+TIME_THRESHOLD = 1.25
+MEMORY_THRESHOLD = 1.25
+MIN_SECONDS = 0.002
+MIN_BYTES = 2**20
+
+# Radon throughput case: order, Katz criterion and images per batch
+RADON_N = 257
+RADON_K = 0.5
+RADON_BATCH = 32
+
+# Multi-process generation case: order and Katz criterion
+PARALLEL_N = 5000
+PARALLEL_K = 0.25
+
+REFERENCE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "Fractal Visualisation")
+REFERENCES = {"corner": "test.py", "centre": "test_2.py"}
+REFERENCE_N_VALUES = (50, 101, 257)
+REFERENCE_K_VALUES = (0.01, 0.1, 0.3, 0.5)
+
+# Orders whose Katz index breakpoints are checked
+BREAKPOINT_N_VALUES = range(2, 300)
+
+# Set operations checked on grids against point arrays: (N1, K1, N2, K2)
+# operand pairs, including an empty operand and mismatched orders, and the
+# match radii they are checked at
+SET_OPERATION_CASES = ((257, 0.1, 257, 0.3), (257, 0.1, 257, 0), (257, 0, 257, 0.1),
+                       (500, 0.05, 257, 0.1), (257, 0.1, 500, 0.05))
+SET_OPERATION_RADII = (0, 1, 2.5, 5)
+
+def measure(fn, repeat=REPEAT):
+    """Timing statistics, peak traced allocation and output size of fn()."""
+    tracemalloc.start()
+    try:
+        output = fn()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+
+    return {
+        "median": statistics.median(times),
+        "min": min(times),
+        "mean": statistics.fmean(times),
+        "stdev": statistics.stdev(times) if len(times) > 1 else 0.0,
+        "peak_bytes": peak,
+        "points": _size(output),
+    }
+
+def pipeline_stages(origin, N, K):
+    """(name, fn) for each stage of one origin's pipeline, fed by the stage before."""
+    transforms, fractal = katz_index.pipeline(origin)
+    farey_seq = farey.farey_array(N)
+    grid_points = transforms.farey_to_grid(farey_seq)
+    full_points = transforms.generate_full_plane(grid_points, N)
+    sorted_points = transforms.sort_points_by_distance(full_points)
+    selected = criteria.apply_katz_criterion(sorted_points, K)
+    points = fractal.map_to_periodic_lines(selected, N)
+    grid = FractalGrid.from_points(points, N)
+
+    return [
+        ("farey", lambda: farey.farey_array(N)),
+        ("farey_to_grid", lambda: transforms.farey_to_grid(farey_seq)),
+        ("generate_full_plane", lambda: transforms.generate_full_plane(grid_points, N)),
+        ("sort_points_by_distance", lambda: transforms.sort_points_by_distance(full_points)),
+        ("apply_katz_criterion", lambda: criteria.apply_katz_criterion(sorted_points, K)),
+        ("generate_katz_plane", lambda: transforms.generate_katz_plane(N, K)),
+        ("map_to_periodic_lines", lambda: fractal.map_to_periodic_lines(selected, N)),
+        ("map_to_distinct_lines", lambda: fractal.map_to_distinct_lines(selected, N)),
+        ("grid", lambda: FractalGrid.from_points(points, N)),
+        ("generate_fractal_points", lambda: fractal.generate_fractal_points(N, K)),
+        ("generate_fractal_grid", lambda: fractal.generate_fractal_grid(N, K)),
+        ("fractal_dimension", lambda: metrics.fractal_dimension(grid)),
+    ]
+
+def comparison_stages(N, K):
+    """(name, fn) for the stages comparing the corner and centre fractals."""
+    grid1 = katz_index.get_index(N, "corner").generate_fractal_grid(K)
+    grid2 = katz_index.get_index(N, "centre").generate_fractal_grid(K)
+
+    return [
+        ("fractal_distance", lambda: metrics.fractal_distance(grid1, grid2)),
+        ("intersect_points", lambda: intersect.intersect_points(grid1, grid2)),
+        ("difference_points", lambda: intersect.difference_points(grid1, grid2)),
+    ]
+
+def case_cells(N, K):
+    """Number of fractal points generated for (N, K), the larger over both origins."""
+    return max(katz_index.get_index(N, origin).count(K) for origin in ORIGINS) * N
+
+def run(N_values=N_VALUES, K_values=K_VALUES, origins=ORIGINS, repeat=REPEAT, log=print):
+    """Benchmark every stage over the grid, keyed by "stage/origin/N/K"."""
+    results = {}
+    for N in N_values:
+        for K in K_values:
+            if case_cells(N, K) > MAX_CELLS:
+                log(f"skip N={N} K={K}: more than {MAX_CELLS} cells")
+                continue
+
+            cases = [(origin, pipeline_stages(origin, N, K)) for origin in origins]
+            cases.append(("both", comparison_stages(N, K)))
+            for origin, stages in cases:
+                for name, fn in stages:
+                    key = f"{name}/{origin}/{N}/{K}"
+                    results[key] = measure(fn, repeat)
+                    log(_format_row(key, results[key]))
+    return results
+
+def compare(results, baseline, time_threshold=TIME_THRESHOLD, memory_threshold=MEMORY_THRESHOLD):
+    """(key, metric, baseline value, current value) for every regression against a baseline."""
+    regressions = []
+    for key, current in results.items():
+        previous = baseline.get(key)
+        if previous is None:
+            continue
+        if (current["median"] > previous["median"] * time_threshold
+                and current["median"] - previous["median"] > MIN_SECONDS):
+            regressions.append((key, "median", previous["median"], current["median"]))
+        if (current["peak_bytes"] > previous["peak_bytes"] * memory_threshold
+                and current["peak_bytes"] - previous["peak_bytes"] > MIN_BYTES):
+            regressions.append((key, "peak_bytes", previous["peak_bytes"], current["peak_bytes"]))
+    return regressions
+
+def radon_loop(images, directions, N):
+    """Projections of each image along each direction, one at a time."""
+    x, y = np.indices((N, N))
+    projections = np.zeros((len(images), len(directions), N))
+    for i, image in enumerate(images):
+        for d, (b, a) in enumerate(directions):
+            bins = (a * x - b * y) % N
+            projections[i, d] = np.bincount(bins.ravel(), weights=image.ravel(), minlength=N)
+    return projections
+
+def radon_throughput(N=RADON_N, K=RADON_K, batch=RADON_BATCH, repeat=REPEAT):
+    """Images per second projected by radon.PeriodicRadon and by radon_loop.
+
+    Building the transform's index tables is timed separately, once per
+    set of directions; the two outputs are checked to agree.
+    """
+    images = np.random.default_rng(0).random((batch, N, N))
+    transform = radon.PeriodicRadon.from_selection(N, K)
+    if not np.allclose(transform.project(images), radon_loop(images, transform.directions, N)):
+        raise AssertionError(f"batched Radon projections differ from the loop for N={N} K={K}")
+
+    build = measure(lambda: radon.PeriodicRadon(transform.directions, N), repeat)
+    batched = measure(lambda: transform.project(images), repeat)
+    loop = measure(lambda: radon_loop(images, transform.directions, N), repeat)
+    return {
+        "directions": len(transform.directions),
+        "build": build["median"],
+        "batched": batch / batched["median"],
+        "loop": batch / loop["median"],
+        "speedup": loop["median"] / batched["median"],
+    }
+
+def parallel_speedup(N=PARALLEL_N, K=PARALLEL_K, workers=None, repeat=REPEAT, origins=ORIGINS):
+    """Median seconds of generate_fractal_points and generate_fractal_grid with 1 and with workers processes.
+
+    Returns {(origin, pipeline): stats}; the outputs of both paths are
+    checked to agree.
+    """
+    fractals = {"corner": fractal_corner, "centre": fractal_centre}
+    results = {}
+    for origin in origins:
+        fractal = fractals[origin]
+        for pipeline in ("points", "grid"):
+            generate = getattr(fractal, f"generate_fractal_{pipeline}")
+            if not np.array_equal(np.asarray(_parallel_output(generate(N, K))),
+                                  np.asarray(_parallel_output(generate(N, K, workers=workers)))):
+                raise AssertionError(f"{origin} {pipeline} differ between 1 and {workers} workers for N={N} K={K}")
+            single = measure(lambda: generate(N, K), repeat)["median"]
+            parallel = measure(lambda: generate(N, K, workers=workers), repeat)["median"]
+            results[(origin, pipeline)] = {"single": single, "parallel": parallel, "speedup": single / parallel}
+    return results
+
+def _parallel_output(output):
+    return output.bits if isinstance(output, FractalGrid) else output
+
+def load_reference(origin):
+    """Imports and function definitions of an origin's reference script."""
+    path = os.path.join(REFERENCE_DIR, REFERENCES[origin])
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+
+    # Drop the module-level plotting calls
+    tree.body = [node for node in tree.body if isinstance(node, (ast.Import, ast.ImportFrom, ast.FunctionDef))]
+    namespace = {}
+    exec(compile(tree, path, "exec"), namespace)
+    return namespace
+
+def check_equivalence(N_values=REFERENCE_N_VALUES, K_values=REFERENCE_K_VALUES, origins=ORIGINS):
+    """(origin, N, K, stage) for every output that differs from the reference implementation."""
+    mismatches = []
+    for origin in origins:
+        ref = load_reference(origin)
+        _, fractal = katz_index.pipeline(origin)
+        for N in N_values:
+            full_points = ref["generate_full_plane"](ref["farey_to_grid"](ref["farey_sequence"](N)), N)
+            sorted_points = ref["sort_points_by_distance"](full_points)
+            for K in K_values:
+                selected = ref["apply_katz_criterion"](sorted_points, N, K)
+                expected = {
+                    "select_points": np.array(selected, dtype=np.int64).reshape(-1, 2),
+                    "generate_fractal_points": np.array(ref["map_to_periodic_lines"](selected, N)).reshape(-1, 2),
+                }
+                actual = {
+                    "select_points": fractal.select_points(N, K),
+                    "generate_fractal_points": fractal.generate_fractal_points(N, K),
+                }
+                for stage in expected:
+                    if not np.array_equal(expected[stage], actual[stage]):
+                        mismatches.append((origin, N, K, stage))
+    return mismatches
+
+def check_breakpoints(N_values=BREAKPOINT_N_VALUES, origins=ORIGINS):
+    """(origin, N, K) for every breakpoint K that is not the smallest K giving its selection."""
+    mismatches = []
+    for origin in origins:
+        for N in N_values:
+            index = katz_index.KatzIndex(N, origin)
+            for K in index.breakpoints():
+                below = np.nextafter(K, -np.inf)
+                if K > 0 and index.count(below) == index.count(K):
+                    mismatches.append((origin, N, float(K)))
+    return mismatches
+
+def check_set_operations(cases=SET_OPERATION_CASES, radii=SET_OPERATION_RADII):
+    """(operation, N1, K1, N2, K2, radius) for every grid result that differs from the point-array one."""
+    operations = {
+        "union": intersect.union_points,
+        "intersection": intersect.intersect_points,
+        "difference": intersect.difference_points,
+        "symmetric_difference": intersect.symmetric_difference_points,
+    }
+    mismatches = []
+    for N1, K1, N2, K2 in cases:
+        grid1 = fractal_corner.generate_fractal_grid(N1, K1)
+        grid2 = fractal_corner.generate_fractal_grid(N2, K2)
+        points1, points2 = grid1.to_points(), grid2.to_points()
+        for radius in radii:
+            for name, operation in operations.items():
+                expected = operation(points1, points2, radius=radius).reshape(-1, 2)
+                actual = operation(grid1, grid2, radius=radius).to_points()
+                if not np.array_equal(expected, actual):
+                    mismatches.append((name, N1, K1, N2, K2, radius))
+    return mismatches
+
+def save(path, results):
+    meta = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "processor": platform.processor(),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+    with open(path, "w") as f:
+        json.dump({"meta": meta, "results": results}, f, indent=1)
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)["results"]
+
+def _size(output):
+    if isinstance(output, FractalGrid):
+        return output.count()
+    if isinstance(output, np.ndarray) and output.ndim:
+        return len(output)
+    return None
+
+def _format_row(key, stats):
+    points = "" if stats["points"] is None else stats["points"]
+    return (f"{key:<48} {stats['median'] * 1e3:10.2f} ms  ±{stats['stdev'] * 1e3:7.2f}"
+            f"  {stats['peak_bytes'] / 2**20:9.1f} MB  {points}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the fractal pipeline stages.")
+    parser.add_argument("--N", type=int, nargs="+", default=None, help="Orders to benchmark.")
+    parser.add_argument("--K", type=float, nargs="+", default=list(K_VALUES), help="Katz criteria to benchmark.")
+    parser.add_argument("--origin", nargs="+", default=list(ORIGINS), choices=list(ORIGINS))
+    parser.add_argument("--repeat", type=int, default=REPEAT, help="Timed runs per stage.")
+    parser.add_argument("--quick", action="store_true", help=f"Only N in {QUICK_N_VALUES}.")
+    parser.add_argument("--save", metavar="PATH", help="Write the results as a baseline.")
+    parser.add_argument("--baseline", metavar="PATH", help="Compare against a saved baseline.")
+    parser.add_argument("--time-threshold", type=float, default=TIME_THRESHOLD)
+    parser.add_argument("--memory-threshold", type=float, default=MEMORY_THRESHOLD)
+    parser.add_argument("--check-only", action="store_true", help="Only check against the reference scripts.")
+    parser.add_argument("--radon", type=int, metavar="BATCH",
+                        help="Only measure Radon projection throughput for batches of this many images.")
+    parser.add_argument("--workers", type=int, metavar="W",
+                        help="Only measure multi-process generation with W workers against one process.")
+    args = parser.parse_args(argv)
+
+    if args.radon:
+        for N in args.N or [RADON_N]:
+            for K in args.K if args.N else [RADON_K]:
+                stats = radon_throughput(N, K, args.radon, args.repeat)
+                print(f"radon N={N} K={K} directions={stats['directions']}: {stats['batched']:.1f} images/s batched, "
+                      f"{stats['loop']:.1f} images/s loop ({stats['speedup']:.1f}x), "
+                      f"tables built in {stats['build'] * 1e3:.0f} ms")
+        return 0
+
+    if args.workers:
+        print(f"parallel generation with {args.workers} workers on {os.cpu_count()} cores")
+        for N in args.N or [PARALLEL_N]:
+            for K in args.K if args.N else [PARALLEL_K]:
+                for (origin, pipeline), stats in parallel_speedup(N, K, args.workers, args.repeat, args.origin).items():
+                    print(f"{origin} {pipeline} N={N} K={K}: {stats['single']:.3f}s single, "
+                          f"{stats['parallel']:.3f}s parallel ({stats['speedup']:.2f}x)")
+        return 0
+
+    failed = False
+    mismatches = check_equivalence(origins=args.origin)
+    for origin, N, K, stage in mismatches:
+        print(f"MISMATCH {stage} for {origin} N={N} K={K} differs from {REFERENCES[origin]}")
+    print(f"reference check: {len(mismatches)} mismatches")
+    failed |= bool(mismatches)
+    backend_mismatches = backends.verify()
+    for name, kernel, N in backend_mismatches:
+        print(f"MISMATCH {kernel} of the {name} backend differs from numpy for N={N}")
+    print(f"backend check ({', '.join(backends.available())}): {len(backend_mismatches)} mismatches")
+    failed |= bool(backend_mismatches)
+    breakpoint_mismatches = check_breakpoints(origins=args.origin)
+    for origin, N, K in breakpoint_mismatches:
+        print(f"MISMATCH breakpoint {K!r} for {origin} N={N} selects the same points one step lower")
+    print(f"breakpoint check: {len(breakpoint_mismatches)} mismatches")
+    failed |= bool(breakpoint_mismatches)
+    set_mismatches = check_set_operations()
+    for name, N1, K1, N2, K2, radius in set_mismatches:
+        print(f"MISMATCH {name} of grids N={N1} K={K1} and N={N2} K={K2} at radius {radius} differs from points")
+    print(f"set operation check: {len(set_mismatches)} mismatches")
+    failed |= bool(set_mismatches)
+    if args.check_only:
+        return 1 if failed else 0
+
+    N_values = args.N or (QUICK_N_VALUES if args.quick else N_VALUES)
+    results = run(N_values, args.K, args.origin, args.repeat)
+
+    if args.save:
+        save(args.save, results)
+        print(f"saved {len(results)} results to {args.save}")
+    if args.baseline:
+        regressions = compare(results, load(args.baseline), args.time_threshold, args.memory_threshold)
+        for key, metric, previous, current in regressions:
+            print(f"REGRESSION {key} {metric}: {previous:.4g} -> {current:.4g} ({current / previous:.2f}x)")
+        print(f"baseline check: {len(regressions)} regressions")
+        failed |= bool(regressions)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
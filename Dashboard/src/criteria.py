@@ -8,20 +8,16 @@
 # -----------------------------------------------------------------------------
 
 import numpy as np
+from src import backends
 
 def apply_katz_criterion(points, K):
     """Filter points using Katz criterion with threshold K."""
-    if not points:
-        return []
+    pts = np.asarray(points).reshape(-1, 2)
+    if len(pts) == 0:
+        return pts
 
-    pts = np.asarray(points, dtype=float)
-    max_x = np.max(np.abs(pts[:, 0]))
-    max_y = np.max(np.abs(pts[:, 1]))
-    threshold = max(max_x, max_y) * K
+    threshold = np.abs(pts).max() * K
 
     # Use squared distance to avoid sqrt
-    sqd = pts[:, 0]**2 + pts[:, 1]**2
-    mask = sqd <= threshold**2
-    filtered = pts[mask]
-    return [tuple(row) for row in filtered]
-
+    mask = backends.current().katz_mask(pts, threshold**2)
+    return pts[mask]
@@ -1,17 +1,23 @@
 # -----------------------------------------------------------------------------
 # farey.py
 # -----------------------------------------------------------------------------
-# Function for generating Farey sequences of order N.
+# Functions for generating Farey sequences of order N, either as Fractions,
+# as a stream of integer (numerator, denominator) pairs, or as a preallocated
+# integer array. A FareyTable holds the terms for a maximum order once and
+# serves every lower order from it.
 #
 # Author: Daniel Cottrell
 # Part of the Farey fractal project.
 # -----------------------------------------------------------------------------
 
+import threading
 from fractions import Fraction
+import numpy as np
 
-def farey_sequence(N):
-    """Generates a Farey sequence of order N."""
-    sequence = [Fraction(0, 1), Fraction(1, 1)]
+def farey_pairs(N):
+    """Yields the terms of the Farey sequence of order N as (a, b) integer pairs."""
+    yield 0, 1
+    yield 1, 1
     a1, b1 = 0, 1
     a2, b2 = 1, 1
 
@@ -19,14 +25,90 @@ def farey_sequence(N):
         a3, b3 = a1 + a2, b1 + b2
         if b3 > N:
             break
-        sequence.append(Fraction(a3, b3))
+        yield a3, b3
 
         if b1 + b2 > N:
             break
-        if a3 / b3 < 1:
+        # a3 / b3 < 1 without the float division
+        if a3 < b3:
             a1, b1 = a3, b3
         else:
             a2, b2 = a3, b3
 
-    return sequence
+def farey_length(N):
+    """Number of terms produced for order N."""
+    # The mediant walk starts between 0/1 and 1/1 and every mediant is below
+    # one, so only the left endpoint ever moves: the terms after 0/1 and 1/1
+    # are exactly k/(k+1) for k = 1 .. N-1.
+    return max(N, 1) + 1
+
+def farey_array(N):
+    """Farey sequence of order N as an (L, 2) int64 array of (a, b) rows."""
+    terms = np.empty((farey_length(N), 2), dtype=np.int64)
+    terms[0] = (0, 1)
+    terms[1] = (1, 1)
+    terms[2:, 0] = np.arange(1, len(terms) - 1)
+    terms[2:, 1] = terms[2:, 0] + 1
+    return terms
+
+def farey_terms_by_denominator(denominators, N):
+    """Terms of farey_array(N) with the given denominators, and their positions."""
+    b = np.asarray(denominators, dtype=np.int64).ravel()
+    b = b[(b >= 1) & (b <= max(N, 1))]
+
+    # Denominator 1 holds both 0/1 and 1/1; every other b holds only (b-1)/b,
+    # which sits at position b
+    ones = np.count_nonzero(b == 1)
+    rest = b[b != 1]
+
+    terms = np.empty((2 * ones + len(rest), 2), dtype=np.int64)
+    positions = np.empty(len(terms), dtype=np.int64)
+    terms[:2 * ones] = np.tile([(0, 1), (1, 1)], (ones, 1))
+    positions[:2 * ones] = np.tile([0, 1], ones)
+    terms[2 * ones:, 0] = rest - 1
+    terms[2 * ones:, 1] = rest
+    positions[2 * ones:] = rest
+    return terms, positions
+
+def farey_sequence(N):
+    """Generates a Farey sequence of order N."""
+    return [Fraction(a, b) for a, b in farey_pairs(N)]
+
+class FareyTable:
+    """Farey terms for every order up to N_max, ordered by denominator.
+
+    The terms of order N are exactly those with denominator <= N, so any
+    order is served as a zero-copy prefix of the arrays.
+    """
+
+    def __init__(self, N_max):
+        self.N_max = N_max
+        self.terms = farey_array(N_max)
+        self.numerators = self.terms[:, 0]
+        self.denominators = self.terms[:, 1]
+
+    def length(self, N):
+        """Number of terms of order N."""
+        if N > self.N_max:
+            raise ValueError(f"order {N} exceeds the table's maximum order {self.N_max}")
+        return int(np.searchsorted(self.denominators, max(N, 1), side="right"))
+
+    def prefix(self, N):
+        """Terms of order N as an (L, 2) view of (a, b) rows, equal to farey_array(N)."""
+        return self.terms[:self.length(N)]
+
+    def mask(self, N):
+        """Boolean mask over the table selecting the terms of order N."""
+        return self.denominators <= max(N, 1)
+
+_table = None
+_table_lock = threading.Lock()
 
+def shared_table(N):
+    """Process-wide FareyTable covering order N, grown by doubling as needed."""
+    global _table
+    with _table_lock:
+        if _table is None or _table.N_max < N:
+            previous = _table.N_max if _table is not None else 0
+            _table = FareyTable(max(N, 2 * previous))
+        return _table
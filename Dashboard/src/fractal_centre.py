@@ -15,26 +15,139 @@
 # Part of the Farey fractal project.
 # -----------------------------------------------------------------------------
 
-from src import farey, transforms_centre, criteria
+import numpy as np
+from src import backends, farey, parallel, transforms_centre, criteria, instrument, lines
+from src.grid import FractalGrid
+
+# Default number of points per chunk when streaming a fractal
+CHUNK_POINTS = 2**20
+
+# Default number of cells written per pass over a memory-mapped grid
+MEMMAP_CHUNK_POINTS = 2**21
 
 def map_to_periodic_lines(points, N):
     """Map points to periodic lines modulo N."""
-    periodic_points = []
+    pts = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+    steps = np.arange(N, dtype=np.int64)
     center = N // 2
-    for b, a in points:
-        for i in range(N):
-            x = (b * i + center) % N
-            y = (a * i + center) % N
-            periodic_points.append((x, y))
+
+    # Row j holds the N points of the line through the j-th selected point
+    periodic_points = np.empty((len(pts) * N, 2), dtype=np.int32)
+    periodic_points[:, 0] = ((np.outer(pts[:, 0], steps) + center) % N).ravel()
+    periodic_points[:, 1] = ((np.outer(pts[:, 1], steps) + center) % N).ravel()
+
     return periodic_points
 
-def generate_fractal_points(N, K):
-    """Full pipeline to generate fractal points."""
-    farey_seq = farey.farey_sequence(N)
-    grid_points = transforms_centre.farey_to_grid(farey_seq)
-    full_points = transforms_centre.generate_full_plane(grid_points, N)
-    sorted_points = transforms_centre.sort_points_by_distance(full_points)
-    selected_points = criteria.apply_katz_criterion(sorted_points, K)
+def trace_lines(points, periods, N):
+    """Cells of one period of the periodic line through each point, as from lines.distinct_lines."""
+    return backends.current().trace_lines(points, periods, N, offset=N // 2)
+
+def fill_lines(mask, points, periods, N):
+    """Mark the cells of one period of the line through each point in an (N, N) bool mask."""
+    backends.current().fill_lines(mask, points, periods, N, offset=N // 2)
+
+def fill_grid(grid, points, N):
+    """Mark the cells of one period of the line through each point in an N x N FractalGrid, a band of rows at a time."""
+    lines.fill_grid(grid, points, N, offset=N // 2)
+
+def cover_lines(coverage, points, periods, N, delta=1):
+    """Add delta to the cells of one period of the line through each point in an (N, N) count array."""
+    backends.current().cover_lines(coverage, points, periods, N, offset=N // 2, delta=delta)
+
+def map_to_distinct_lines(points, N):
+    """Cells of the periodic lines through points, each distinct line traced once.
+
+    Covers the same cells as map_to_periodic_lines without its repeats:
+    points on a common line are mapped once, over one period of the line.
+    """
+    return trace_lines(*lines.distinct_lines(points, N), N)
+
+def select_points(N, K, pruned=True, table=None):
+    """Mirrored Farey points kept by the Katz criterion, sorted by distance.
+
+    With pruned=True only the candidates inside the Katz radius are
+    enumerated; otherwise the full plane is generated, sorted and filtered,
+    taking the Farey terms from a shared farey.FareyTable when one is given.
+    """
+    if pruned:
+        with instrument.stage("generate_katz_plane", origin="centre", N=N, K=K) as record:
+            selected = transforms_centre.generate_katz_plane(N, K)
+            record["points"] = len(selected)
+        return selected
+
+    with instrument.stage("farey", N=N) as record:
+        farey_seq = table.prefix(N) if table is not None else farey.farey_array(N)
+        record["points"] = len(farey_seq)
+    with instrument.stage("farey_to_grid", origin="centre", N=N, points=len(farey_seq)):
+        grid_points = transforms_centre.farey_to_grid(farey_seq)
+    with instrument.stage("generate_full_plane", origin="centre", N=N) as record:
+        full_points = transforms_centre.generate_full_plane(grid_points, N)
+        record["points"] = len(full_points)
+    with instrument.stage("sort_points_by_distance", origin="centre", N=N, points=len(full_points)):
+        sorted_points = transforms_centre.sort_points_by_distance(full_points)
+    with instrument.stage("apply_katz_criterion", origin="centre", N=N, K=K) as record:
+        selected = criteria.apply_katz_criterion(sorted_points, K)
+        record["points"] = len(selected)
+    return selected
+
+def generate_fractal_points(N, K, pruned=True, workers=1):
+    """Full pipeline to generate fractal points as an (M, 2) int32 array.
+
+    With workers other than 1 the lines are mapped by that many processes
+    (None for one per core) into shared memory; the points are the same.
+    """
+    selected_points = select_points(N, K, pruned=pruned)
+
+    with instrument.stage("map_to_periodic_lines", origin="centre", N=N, K=K, points=len(selected_points) * N):
+        if workers != 1:
+            return parallel.periodic_points(selected_points, N, "centre", workers)
+        return map_to_periodic_lines(selected_points, N)
+
+def stream_fractal_points(N, K, chunk_points=CHUNK_POINTS, distinct=False):
+    """Fractal points in chunks of whole lines, at most about chunk_points points each.
+
+    Concatenated, the chunks equal generate_fractal_points(N, K), so the
+    fractal can be consumed (e.g. by the sinks in sinks.py) without ever
+    holding all of it. With distinct=True each distinct line is traced once
+    over its period instead, giving the same cells without the repeats.
+    """
+    selected_points = select_points(N, K)
+    per_chunk = max(1, chunk_points // max(N, 1))
+    if distinct:
+        directions, periods = lines.distinct_lines(selected_points, N)
+        for start in range(0, len(directions), per_chunk):
+            yield trace_lines(directions[start:start + per_chunk], periods[start:start + per_chunk], N)
+    else:
+        for start in range(0, len(selected_points), per_chunk):
+            yield map_to_periodic_lines(selected_points[start:start + per_chunk], N)
+
+def generate_fractal_grid(N, K, workers=1):
+    """Full pipeline to generate the fractal as an N x N occupancy grid.
+
+    With workers other than 1 the lines are split across that many
+    processes (None for one per core) writing into one shared mask.
+    """
+    directions, periods = lines.distinct_lines(select_points(N, K), N)
+    with instrument.stage("grid", origin="centre", N=N, K=K, points=int(periods.sum())):
+        if workers != 1:
+            return FractalGrid.from_mask(parallel.occupancy_mask(directions, periods, N, "centre", workers))
+        mask = np.zeros((N, N), dtype=bool)
+        fill_lines(mask, directions, periods, N)
+        return FractalGrid.from_mask(mask)
 
-    return map_to_periodic_lines(selected_points, N)
+def generate_fractal_memmap(N, K, path, chunk_points=MEMMAP_CHUNK_POINTS):
+    """Full pipeline writing the fractal to a memory-mapped occupancy grid in the .npy file at path.
 
+    For N too large to hold the grid in memory. Distinct lines are traced in
+    chunks of about chunk_points cells, and each chunk is written to the
+    file one band of rows at a time. Reopen with FractalGrid.open_memmap.
+    """
+    grid = FractalGrid.create_memmap(path, N)
+    with instrument.stage("memmap_grid", origin="centre", N=N, K=K) as record:
+        points = 0
+        for chunk in stream_fractal_points(N, K, chunk_points, distinct=True):
+            grid.add_points(chunk)
+            points += len(chunk)
+        grid.flush()
+        record["points"] = points
+    return grid
@@ -0,0 +1,293 @@
+# -----------------------------------------------------------------------------
+# grid.py
+# -----------------------------------------------------------------------------
+# Bit-packed occupancy grid for fractals on the discrete N x N torus.
+#
+# Every fractal point is an integer cell (x, y) with 0 <= x, y < N, so a
+# fractal is fully described by which cells are occupied. Storing one bit per
+# cell removes the heavy duplication between overlapping periodic lines and
+# lets set operations and box-counting run as bitwise array operations.
+#
+# Grids too large for memory can live in a memory-mapped .npy file
+# (create_memmap / open_memmap); counting, box-counting and point updates
+# then work on the packed rows a band at a time.
+#
+# Author: Daniel Cottrell
+# Part of the Farey fractal project.
+# -----------------------------------------------------------------------------
+
+import numpy as np
+from src import backends
+
+# Packed bytes processed at once when pooling large regions
+BAND_BYTES = 2**24
+
+# Number of set bits in every possible byte value
+_POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+# Number of non-zero bit pairs and nibbles in every possible byte value
+_PAIRS = np.array([sum(i >> s & 3 != 0 for s in (0, 2, 4, 6)) for i in range(256)], dtype=np.uint8)
+_NIBBLES = np.array([(i & 0x0F != 0) + (i & 0xF0 != 0) for i in range(256)], dtype=np.uint8)
+
+class FractalGrid:
+    """Occupancy mask of a fractal on an N x N grid, stored one bit per cell.
+
+    The mask is indexed as mask[x, y] for a point (x, y), and is packed along
+    y so each row x uses ceil(N / 8) bytes.
+    """
+
+    def __init__(self, N, bits=None):
+        self.N = int(N)
+        row_bytes = (self.N + 7) // 8
+        if bits is None:
+            bits = np.zeros((self.N, row_bytes), dtype=np.uint8)
+        self.bits = bits
+
+    @classmethod
+    def from_mask(cls, mask):
+        """Build a grid from a square boolean mask."""
+        mask = np.asarray(mask, dtype=bool)
+        return cls(mask.shape[0], np.packbits(mask, axis=1))
+
+    @classmethod
+    def from_points(cls, points, N):
+        """Build a grid from an (M, 2) array of integer points."""
+        pts = np.asarray(points).reshape(-1, 2).astype(np.int64)
+        mask = np.zeros((N, N), dtype=bool)
+        mask[pts[:, 0] % N, pts[:, 1] % N] = True
+        return cls.from_mask(mask)
+
+    @classmethod
+    def create_memmap(cls, path, N):
+        """Empty grid backed by a new memory-mapped .npy file at path."""
+        bits = np.lib.format.open_memmap(path, mode="w+", dtype=np.uint8, shape=(int(N), (int(N) + 7) // 8))
+        return cls(N, bits)
+
+    @classmethod
+    def open_memmap(cls, path, mode="r"):
+        """Grid backed by an existing .npy file written by create_memmap."""
+        bits = np.load(path, mmap_mode=mode)
+        return cls(bits.shape[0], bits)
+
+    @property
+    def is_memmap(self):
+        """Whether the packed bits live in a memory-mapped file."""
+        return isinstance(self.bits, np.memmap)
+
+    def flush(self):
+        """Write pending changes of a memory-mapped grid to its file."""
+        if self.is_memmap:
+            self.bits.flush()
+
+    def band_rows(self):
+        """Rows in a band of about BAND_BYTES packed bytes."""
+        return max(1, BAND_BYTES // self.bits.shape[1])
+
+    def bands(self, rows=None):
+        """(first row, packed rows) of consecutive bands of rows, band_rows() each by default."""
+        rows = rows or self.band_rows()
+        for start in range(0, self.N, rows):
+            yield start, self.bits[start:start + rows]
+
+    def add_points(self, points):
+        """Mark an (M, 2) array of integer points occupied in place.
+
+        Returns the number of cells that were not occupied before.
+        """
+        pts = np.asarray(points).reshape(-1, 2).astype(np.int64) % self.N
+        if len(pts) == 0:
+            return 0
+
+        # Sorting the cells groups them by byte, so each touched byte is
+        # updated once with the OR of its new bits
+        cells = np.sort(pts[:, 0] * (self.bits.shape[1] * 8) + pts[:, 1])
+        index = cells >> 3
+        bit = (0x80 >> (cells & 7)).astype(np.uint8)
+        starts = np.flatnonzero(np.r_[True, index[1:] != index[:-1]])
+        index, bits = index[starts], np.bitwise_or.reduceat(bit, starts)
+
+        flat = self.bits.reshape(-1)
+        if not self.is_memmap:
+            added = int(_POPCOUNT[bits & ~flat[index]].sum(dtype=np.int64))
+            flat[index] |= bits
+            return added
+
+        # Read, update and write back each touched band whole, so the file
+        # is accessed sequentially rather than page by page
+        band = self.band_rows() * self.bits.shape[1]
+        bands = index // band
+        bounds = np.flatnonzero(np.r_[True, bands[1:] != bands[:-1], True])
+        added = 0
+        for lo, hi in zip(bounds[:-1], bounds[1:]):
+            first = int(bands[lo]) * band
+            block = np.array(flat[first:first + band])
+            local = index[lo:hi] - first
+            added += int(_POPCOUNT[bits[lo:hi] & ~block[local]].sum(dtype=np.int64))
+            block[local] |= bits[lo:hi]
+            flat[first:first + band] = block
+        return added
+
+    @property
+    def mask(self):
+        """Unpacked (N, N) boolean occupancy mask."""
+        return np.unpackbits(self.bits, axis=1, count=self.N).astype(bool)
+
+    @property
+    def nbytes(self):
+        """Memory used by the packed mask."""
+        return self.bits.nbytes
+
+    def to_points(self):
+        """Occupied cells as an (M, 2) int32 array sorted by (x, y)."""
+        return np.argwhere(self.mask).astype(np.int32)
+
+    def count(self):
+        """Number of occupied cells."""
+        return sum(int(_POPCOUNT[band].sum(dtype=np.int64)) for _, band in self.bands())
+
+    def max_coordinate(self):
+        """Largest x or y of any occupied cell, or -1 when empty."""
+        last_row = -1
+        columns = np.zeros(self.bits.shape[1], dtype=np.uint8)
+        for start, band in self.bands():
+            rows = np.flatnonzero(band.any(axis=1))
+            if len(rows):
+                last_row = start + int(rows[-1])
+                columns |= np.bitwise_or.reduce(band, axis=0)
+        if last_row < 0:
+            return -1
+        cols = np.flatnonzero(np.unpackbits(columns, count=self.N))
+        return int(max(last_row, cols[-1]))
+
+    def pooled(self, size):
+        """Boolean mask of which size x size boxes (anchored at the origin) are occupied."""
+        boxes = -(-self.N // size)
+        padded = np.zeros((boxes * size, boxes * size), dtype=bool)
+        padded[:self.N, :self.N] = self.mask
+        return padded.reshape(boxes, size, boxes, size).any(axis=(1, 3))
+
+    def pyramid_counts(self, levels):
+        """Occupied 2^k x 2^k boxes (anchored at the origin) for k = 0 .. levels.
+
+        Pools the packed rows band by band, so it runs in bounded memory on
+        grids of any size. Bands are 2^b rows, so boxes up to 2^b never
+        straddle two bands and their counts add up over the bands; each band
+        also leaves one row of its 2^b boxes in a small coarse mask, whose
+        pyramid gives the larger sizes.
+        """
+        top = max(int(np.log2(self.band_rows())), 3)
+        b = min(levels, top)
+        counts = [0] * (b + 1)
+        coarse = []
+        for _, band in self.bands(2**b):
+            for level in range(b + 1):
+                if level:
+                    band = np.pad(band, ((0, len(band) % 2), (0, 0)))
+                    band = band[0::2] | band[1::2]
+                counts[level] += _level_count(band, level)
+            if b < levels:
+                coarse.append(_byte_boxes(band, b))
+        if b < levels:
+            counts += backends.current().pyramid_counts(np.concatenate(coarse), levels - b)[1:]
+        return counts
+
+    def block_counts(self, x0, y0, size, factor):
+        """Occupied cells in each factor x factor block of the size x size region at (x0, y0).
+
+        Works on the packed rows a band at a time, so a region of any size is
+        pooled in bounded memory. x0, y0 and size must be multiples of
+        factor, y0 and size also multiples of 8; cells outside the grid count
+        as empty.
+        """
+        blocks = size // factor
+        counts = np.zeros((blocks, blocks), dtype=np.int64)
+        byte0, row_bytes = y0 // 8, size // 8
+        band = max(1, BAND_BYTES // (row_bytes * factor)) * factor
+
+        for start in range(x0, min(x0 + size, self.N), band):
+            rows = self.bits[start:min(start + band, x0 + size, self.N), byte0:byte0 + row_bytes]
+            block = np.zeros((-(-len(rows) // factor) * factor, row_bytes), dtype=np.uint8)
+            block[:rows.shape[0], :rows.shape[1]] = rows
+            if factor >= 8:
+                # Whole bytes fall inside one block, so count bits per byte
+                cells = _POPCOUNT[block].reshape(-1, factor, blocks, factor // 8)
+            else:
+                cells = np.unpackbits(block, axis=1).reshape(-1, factor, blocks, factor)
+            first = (start - x0) // factor
+            counts[first:first + cells.shape[0]] = cells.sum(axis=(1, 3))
+        return counts
+
+    def dilate(self, radius, toroidal=False, N=None):
+        """Grid of every cell within Euclidean distance radius of an occupied cell.
+
+        With N larger than the grid's own, the grid is first zero-padded to
+        N x N, so the dilation reaches past its edge.
+        """
+        grid = self if N is None or N == self.N else FractalGrid(N, _pad_bits(self.bits, N))
+        if radius <= 0 or not grid.bits.any():
+            return grid.copy()
+        from scipy import ndimage
+        free = ~grid.mask
+        pad = int(np.ceil(radius)) if toroidal else 0
+        if pad:
+            free = np.pad(free, pad, mode="wrap")
+        near = ndimage.distance_transform_edt(free) <= radius
+        return FractalGrid.from_mask(near[pad:pad + grid.N, pad:pad + grid.N])
+
+    def copy(self):
+        return FractalGrid(self.N, self.bits.copy())
+
+    def _aligned(self, other):
+        """Packed bits of both grids padded to a common size."""
+        if not isinstance(other, FractalGrid):
+            raise TypeError(f"expected FractalGrid, got {type(other).__name__}")
+        if self.N == other.N:
+            return self.N, self.bits, other.bits
+        N = max(self.N, other.N)
+        return N, _pad_bits(self.bits, N), _pad_bits(other.bits, N)
+
+    def __or__(self, other):
+        N, a, b = self._aligned(other)
+        return FractalGrid(N, a | b)
+
+    def __and__(self, other):
+        N, a, b = self._aligned(other)
+        return FractalGrid(N, a & b)
+
+    def __sub__(self, other):
+        N, a, b = self._aligned(other)
+        return FractalGrid(N, a & ~b)
+
+    def __xor__(self, other):
+        N, a, b = self._aligned(other)
+        return FractalGrid(N, a ^ b)
+
+    def __eq__(self, other):
+        if not isinstance(other, FractalGrid):
+            return NotImplemented
+        return self.N == other.N and np.array_equal(self.bits, other.bits)
+
+    def __len__(self):
+        return self.count()
+
+    def __repr__(self):
+        return f"FractalGrid(N={self.N}, occupied={self.count()})"
+
+def _level_count(rows, level):
+    """Occupied 2^level-wide boxes in packed rows already pooled over 2^level rows."""
+    if level < 3:
+        return int((_POPCOUNT, _PAIRS, _NIBBLES)[level][rows].sum(dtype=np.int64))
+    return int(np.count_nonzero(_byte_boxes(rows, level)))
+
+def _byte_boxes(rows, level):
+    """Which 2^level-wide boxes (level >= 3) of packed rows hold a set bit."""
+    width = 2**(level - 3)
+    occupied = rows != 0
+    occupied = np.pad(occupied, ((0, 0), (0, -occupied.shape[1] % width)))
+    return occupied.reshape(len(rows), -1, width).any(axis=2)
+
+def _pad_bits(bits, N):
+    """Zero-pad packed rows to an N x N grid."""
+    padded = np.zeros((N, (N + 7) // 8), dtype=np.uint8)
+    padded[:bits.shape[0], :bits.shape[1]] = bits
+    return padded
@@ -4,44 +4,47 @@
 # Generates a heatmap comparing computed and theoretical fractal dimensions
 # over ranges of Farey order N and Katz parameter K.
 #
+# Importing the module has no side effects and does not load matplotlib; the
+# sweep runs and the figures are shown only from the command line.
+#
+# Usage:
+#   python -m src.heatmap_dimension --N 50 1000 50 --K 0.1 1.0 0.1 --origin Corner
+#
 # Author: Daniel Cottrell
 # Part of the Farey fractal project.
 # -----------------------------------------------------------------------------
 
+import argparse
 import numpy as np
-import matplotlib.pyplot as plt
-import fractal_corner, metrics
+from src import sweep
 
 def theoretical_dimension(N, K):
     """Analytical approximation of fractal dimension from thesis."""
     return 2 - np.log(1 / K) / np.log(N)
 
-def compute_heatmap(N_values, K_values, origin="Corner"):
+def compute_heatmap(N_values, K_values, origin="Corner", store=None,
+                    results_path=None, workers=None):
     """
     Computes fractal dimensions for all combinations of N and K.
     Returns two matrices: computed and theoretical dimensions.
+    The sweep runs in parallel, grouped by N; with a results_path, finished
+    cells are checkpointed there and reused on the next call. Dimensions in
+    the optional FractalStore are reused, and new ones written back to it.
     """
-    D_computed = np.zeros((len(K_values), len(N_values)))
-    D_theoretical = np.zeros((len(K_values), len(N_values)))
-
-    for i, K in enumerate(K_values):
-        for j, N in enumerate(N_values):
-            # Generate fractal points
-            if origin.lower() == "corner":
-                points = fractal_corner.generate_fractal_points(N, K)
-            else:
-                raise NotImplementedError("Centre-origin heatmap not yet implemented")
-
-            # Compute fractal dimension numerically
-            D_computed[i, j] = metrics.fractal_dimension(points)
-            # Compute theoretical dimension from approximation
-            D_theoretical[i, j] = theoretical_dimension(N, K)
+    store_root = store.root if store is not None else None
+    results = sweep.run_sweep(N_values, K_values, [origin], results_path,
+                              workers, store_root)
+
+    D_computed = sweep.results_matrix(results, N_values, K_values, origin)
+    D_theoretical = np.array([[theoretical_dimension(N, K) for N in N_values]
+                              for K in K_values])
 
     return D_computed, D_theoretical
 
 
 def plot_heatmap(N_values, K_values, D_matrix, title, cmap="viridis"):
     """Utility to plot a single heatmap with labeled axes."""
+    import matplotlib.pyplot as plt
     fig, ax = plt.subplots(figsize=(8, 6))
     c = ax.imshow(D_matrix, origin="lower", aspect="auto",
                   extent=[N_values[0], N_values[-1], K_values[0], K_values[-1]],
@@ -55,7 +58,7 @@ def plot_heatmap(N_values, K_values, D_matrix, title, cmap="viridis"):
 
 def generate_dimension_heatmaps(N_min=50, N_max=1000, N_step=50,
                                 K_min=0.1, K_max=1.0, K_step=0.1,
-                                origin="Corner"):
+                                origin="Corner", results_path=None, workers=None):
     """
     Generate both the computed and theoretical dimension heatmaps,
     plus an error map showing their absolute difference.
@@ -63,7 +66,8 @@ def generate_dimension_heatmaps(N_min=50, N_max=1000, N_step=50,
     N_values = np.arange(N_min, N_max + 1, N_step)
     K_values = np.arange(K_min, K_max + 1e-9, K_step)
 
-    D_computed, D_theoretical = compute_heatmap(N_values, K_values, origin=origin)
+    D_computed, D_theoretical = compute_heatmap(N_values, K_values, origin=origin,
+                                                results_path=results_path, workers=workers)
     D_error = np.abs(D_computed - D_theoretical)
 
     fig1 = plot_heatmap(N_values, K_values, D_computed,
@@ -75,9 +79,21 @@ def generate_dimension_heatmaps(N_min=50, N_max=1000, N_step=50,
 
     return fig1, fig2, fig3
 
-# Display the figures
-fig1, fig2, fig3 = generate_dimension_heatmaps()
-
-plt.show()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Heatmaps of computed and theoretical fractal dimension.")
+    parser.add_argument("--N", type=int, nargs=3, metavar=("MIN", "MAX", "STEP"), default=[50, 1000, 50])
+    parser.add_argument("--K", type=float, nargs=3, metavar=("MIN", "MAX", "STEP"), default=[0.1, 1.0, 0.1])
+    parser.add_argument("--origin", default="Corner", choices=["Corner", "Centre"])
+    parser.add_argument("--out", default=None, help="Results file to checkpoint and resume the sweep.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores).")
+    args = parser.parse_args(argv)
+
+    import matplotlib.pyplot as plt
+    generate_dimension_heatmaps(*args.N, *args.K, origin=args.origin,
+                                results_path=args.out, workers=args.workers)
+    plt.show()
+
+if __name__ == "__main__":
+    main()
 
 
@@ -0,0 +1,80 @@
+# -----------------------------------------------------------------------------
+# incremental.py
+# -----------------------------------------------------------------------------
+# Incremental fractal builder for a fixed (N, origin).
+#
+# Katz selection is monotonic in K: the points kept for a larger K are a
+# superset of those kept for a smaller K, and in the norm-sorted index they
+# form a longer prefix. Selected points on a common periodic line share a
+# line class (see lines.py); the builder counts the selected points of each
+# class and how many distinct lines cover each cell, so moving K only traces
+# the lines whose first point enters or last point leaves the prefix.
+#
+# Author: Daniel Cottrell
+# Part of the Farey fractal project.
+# -----------------------------------------------------------------------------
+
+import threading
+import numpy as np
+from src import instrument, katz_index
+from src.grid import FractalGrid
+
+class IncrementalFractal:
+    """Fractal for one (N, origin) that is updated in place as K changes."""
+
+    def __init__(self, N, origin="corner", index=None):
+        self.index = index if index is not None else katz_index.get_index(N, origin)
+        self.N = self.index.N
+        self.origin = self.index.origin
+        _, fractal = katz_index.pipeline(self.origin)
+        self._cover_lines = fractal.cover_lines
+        self._class_ids, self._directions, self._periods = self.index.line_classes()
+
+        # Number of selected points on each line class, number of distinct
+        # selected lines through each cell, and the index prefix length
+        # those lines came from
+        self.refcounts = np.zeros(len(self._directions), dtype=np.int32)
+        self.coverage = np.zeros((self.N, self.N), dtype=np.int32)
+        self.selected = 0
+        self.K = None
+
+        # Held while the coverage changes; callers that read selected_points
+        # after set_K from several threads hold it across both
+        self.lock = threading.RLock()
+
+    def set_K(self, K):
+        """Move to K, touching only the lines that enter or leave, and return the grid."""
+        target = self.index.count(K)
+        with self.lock:
+            with instrument.stage("update_coverage", origin=self.origin, N=self.N, K=K,
+                                  points=abs(target - self.selected)):
+                if target > self.selected:
+                    self._update(self._class_ids[self.selected:target], 1)
+                elif target < self.selected:
+                    self._update(self._class_ids[target:self.selected], -1)
+            self.selected = target
+            self.K = K
+            with instrument.stage("grid", origin=self.origin, N=self.N, K=K):
+                return self.grid()
+
+    def _update(self, class_ids, delta):
+        """Add delta per point to the counts of line classes, covering lines that appear or disappear."""
+        classes, counts = np.unique(class_ids, return_counts=True)
+        before = self.refcounts[classes]
+        self.refcounts[classes] += delta * counts.astype(np.int32)
+        changed = classes[before == 0] if delta > 0 else classes[self.refcounts[classes] == 0]
+        if len(changed):
+            self._cover(changed, delta)
+
+    def _cover(self, classes, delta):
+        """Add delta to the coverage of every cell on the lines of classes."""
+        self._cover_lines(self.coverage, self._directions[classes], self._periods[classes], self.N, delta)
+
+    @property
+    def selected_points(self):
+        """Index points whose lines make up the current fractal."""
+        return self.index.points[:self.selected]
+
+    def grid(self):
+        """Current fractal as an occupancy grid."""
+        return FractalGrid.from_mask(self.coverage > 0)
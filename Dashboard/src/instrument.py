@@ -0,0 +1,221 @@
+# -----------------------------------------------------------------------------
+# instrument.py
+# -----------------------------------------------------------------------------
+# Lightweight per-stage timing and memory instrumentation.
+#
+# Pipeline stages, metrics and plotting calls are wrapped in stage() blocks
+# or the timed() decorator. Nothing is recorded unless instrumentation is
+# switched on, either process-wide (enable(), or the FAREY_PERF environment
+# variable) or for one block of work inside collect(); when off, a stage
+# costs a single context-variable lookup.
+#
+# Each record holds the stage name, wall time, any fields such as N, K or
+# the number of points, and optionally the peak traced allocation. Records
+# go to the collector of the surrounding collect() block and, while enabled
+# process-wide, to the "farey.perf" logger as one JSON object per line.
+# tracemalloc keeps a single peak for the whole process, so a stage that ran
+# while another thread had a stage open gets no peak; its record is flagged
+# with "peak_overlapped" instead.
+#
+# Usage:
+#   FAREY_PERF=1 FAREY_PERF_LOG=perf.jsonl streamlit run app.py
+#   FAREY_PERF=memory python -m src.sweep ...
+#
+# Author: Daniel Cottrell
+# Part of the Farey fractal project.
+# -----------------------------------------------------------------------------
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from src.grid import FractalGrid
+
+logger = logging.getLogger("farey.perf")
+
+_enabled = False
+
+# Records of the innermost collect() block, if any
+_collector = ContextVar("farey_perf_collector", default=None)
+
+# Per-thread stack of open stages, for attributing peaks to nested stages
+_local = threading.local()
+
+# Threads with a stage open, and a count bumped each time stages start to
+# overlap across threads
+_threads_lock = threading.Lock()
+_open_threads = 0
+_overlaps = 0
+
+class _Discard(dict):
+    """Record handed out while instrumentation is off; writes are dropped."""
+
+    def __setitem__(self, key, value):
+        pass
+
+_DISCARD = _Discard()
+
+def enable(memory=False, log_path=None):
+    """Record every stage process-wide, tracing allocations if memory is set."""
+    global _enabled
+    _enabled = True
+    if memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    # One JSON object per line, to a file or by default to stderr
+    if log_path or not logger.handlers:
+        handler = logging.FileHandler(log_path) if log_path else logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    """Whether stages are being recorded, process-wide or by a collector in this context."""
+    return _enabled or _collector.get() is not None
+
+@contextmanager
+def collect(memory=False):
+    """Gather the records of every stage run in this block into the yielded list.
+
+    Background jobs submitted from the block through jobs.JobSlots carry
+    the collector with them.
+    """
+    records = []
+    started = memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    token = _collector.set(records)
+    try:
+        yield records
+    finally:
+        _collector.reset(token)
+        if started:
+            tracemalloc.stop()
+
+def start_collecting():
+    """Collect the records of every later stage in the current context into the returned list.
+
+    For scripts that cannot wrap their work in collect(), such as a
+    Streamlit page; collection lasts until stop_collecting() is called.
+    """
+    records = []
+    _collector.set(records)
+    return records
+
+def stop_collecting():
+    _collector.set(None)
+
+def stage(name, **fields):
+    """Context manager recording one stage; yields a dict for fields known only at the end."""
+    if not is_enabled():
+        return _NULL_STAGE
+    return _stage(name, fields)
+
+@contextmanager
+def _stage(name, fields):
+    global _open_threads, _overlaps
+    record = {"stage": name, **fields}
+    stack = getattr(_local, "stack", None)
+    if stack is None:
+        stack = _local.stack = []
+
+    with _threads_lock:
+        if not stack:
+            _open_threads += 1
+            if _open_threads > 1:
+                _overlaps += 1
+        # A stage starting alongside another thread's can never be attributed
+        overlaps = _overlaps if _open_threads == 1 else None
+
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        current, peak = tracemalloc.get_traced_memory()
+        if stack:
+            stack[-1]["_peak"] = max(stack[-1]["_peak"], peak)
+        tracemalloc.reset_peak()
+        record["_start"], record["_peak"] = current, 0
+    stack.append(record)
+
+    start = time.perf_counter()
+    try:
+        yield record
+    finally:
+        record["seconds"] = time.perf_counter() - start
+        stack.pop()
+        with _threads_lock:
+            overlapped = overlaps != _overlaps
+            if not stack:
+                _open_threads -= 1
+        if tracing and tracemalloc.is_tracing() and not overlapped:
+            peak = max(tracemalloc.get_traced_memory()[1], record.pop("_peak"))
+            record["peak_bytes"] = max(0, peak - record.pop("_start"))
+            if stack:
+                stack[-1]["_peak"] = max(stack[-1]["_peak"], peak)
+        else:
+            if tracing:
+                record["peak_overlapped"] = True
+            record.pop("_peak", None)
+            record.pop("_start", None)
+        _emit(record)
+
+class _NullStage:
+    def __enter__(self):
+        return _DISCARD
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+def timed(name):
+    """Decorator recording each call of a function as a stage.
+
+    The points recorded are those of the result when it is a grid or an
+    array, and otherwise those of the first argument.
+    """
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not is_enabled():
+                return fn(*args, **kwargs)
+            with _stage(name, {}) as record:
+                result = fn(*args, **kwargs)
+                points = _points(result)
+                if points is None and args:
+                    points = _points(args[0])
+                if points is not None:
+                    record["points"] = points
+                return result
+        return wrapper
+    return decorate
+
+def _emit(record):
+    record["thread"] = threading.current_thread().name
+    records = _collector.get()
+    if records is not None:
+        records.append(record)
+    if _enabled and logger.isEnabledFor(logging.INFO):
+        logger.info(json.dumps(record, default=str))
+
+def _points(result):
+    """Number of points in a stage's output, when it has an obvious one."""
+    if isinstance(result, FractalGrid):
+        return result.count()
+    shape = getattr(result, "shape", None)
+    if shape and len(shape) == 2 and shape[1] == 2:
+        return int(shape[0])
+    return None
+
+# Process-wide switch from the environment: "1" for timings, "memory" to
+# also trace allocations
+_mode = os.environ.get("FAREY_PERF", "")
+if _mode:
+    enable(memory=_mode == "memory", log_path=os.environ.get("FAREY_PERF_LOG") or None)
@@ -1,24 +1,134 @@
 # -----------------------------------------------------------------------------
 # intersection.py
 # -----------------------------------------------------------------------------
-# Implements an equality check between sets of points, using a tolerance value.
-# 
+# Set algebra between fractals: union, intersection, difference and
+# symmetric difference.
+#
+# Point sets are compared as sorted integer keys (one int64 per point), and
+# occupancy grids with bitwise operations. Float points are first rounded to
+# tol decimals. A positive radius switches to spatial tolerance: a point
+# matches if the other set has a point within that Euclidean distance, which
+# is resolved with a distance transform (mask dilation) or a KD-tree.
+#
 # Author: Daniel Cottrell
 # Part of the Farey fractal project.
 # -----------------------------------------------------------------------------
 
-def intersect_points(points1, points2, tol=1):
+import numpy as np
+from src import metrics
+from src.grid import FractalGrid
+
+def union_points(points1, points2, tol=1, radius=0):
+    """Points in either set; with a radius, points of the second set near the first are dropped."""
+    if _both_grids(points1, points2):
+        if radius > 0:
+            points2 = points2 - points1.dilate(radius, N=_common_N(points1, points2))
+        return points1 | points2
+    pts1, pts2 = _prepared(points1, points2, tol)
+    if radius > 0:
+        pts2 = pts2[~_near(pts2, pts1, radius)]
+    return _apply("union", pts1, pts2, tol)
+
+def intersect_points(points1, points2, tol=1, radius=0):
     """Find approximate intersection of two sets of points."""
-    set1 = { (round(x, tol), round(y, tol)) for x, y in points1 }
-    set2 = { (round(x, tol), round(y, tol)) for x, y in points2 }
-    
-    return list(set1 & set2)
+    if _both_grids(points1, points2):
+        return points1 & (points2.dilate(radius, N=_common_N(points1, points2)) if radius > 0 else points2)
+    pts1, pts2 = _prepared(points1, points2, tol)
+    if radius > 0:
+        pts1 = _unique(pts1, tol)
+        return pts1[_near(pts1, pts2, radius)]
+    return _apply("intersection", pts1, pts2, tol)
 
-def difference_points(points1, points2, tol=1):
+def difference_points(points1, points2, tol=1, radius=0):
     """Find approximate difference of two sets of points by rounding."""
-    set1 = { (round(x, tol), round(y, tol)) for x, y in points1 }
-    set2 = { (round(x, tol), round(y, tol)) for x, y in points2 }
-    diff = set1 - set2
-    
-    return list(diff)
+    if _both_grids(points1, points2):
+        return points1 - (points2.dilate(radius, N=_common_N(points1, points2)) if radius > 0 else points2)
+    pts1, pts2 = _prepared(points1, points2, tol)
+    if radius > 0:
+        pts1 = _unique(pts1, tol)
+        return pts1[~_near(pts1, pts2, radius)]
+    return _apply("difference", pts1, pts2, tol)
+
+def symmetric_difference_points(points1, points2, tol=1, radius=0):
+    """Points in exactly one of the two sets (up to the tolerance)."""
+    if radius > 0:
+        return union_points(difference_points(points1, points2, tol, radius),
+                            difference_points(points2, points1, tol, radius), tol)
+    if _both_grids(points1, points2):
+        return points1 ^ points2
+    pts1, pts2 = _prepared(points1, points2, tol)
+    return _apply("symmetric_difference", pts1, pts2, tol)
+
+def _both_grids(points1, points2):
+    return isinstance(points1, FractalGrid) and isinstance(points2, FractalGrid)
+
+def _common_N(grid1, grid2):
+    """Size both grids are padded to before they are combined."""
+    return max(grid1.N, grid2.N)
+
+def _prepared(points1, points2, tol):
+    """Both inputs as (M, 2) arrays of a common dtype, floats rounded to tol decimals."""
+    pts = []
+    for points in (points1, points2):
+        if isinstance(points, FractalGrid):
+            points = points.to_points()
+        pts.append(np.asarray(points).reshape(-1, 2))
+
+    dtype = np.result_type(pts[0], pts[1])
+    if dtype.kind not in "iu":
+        return [np.round(p.astype(float), tol) for p in pts]
+    return [p.astype(dtype) for p in pts]
+
+# Set operations as (sorted-key operation, boolean-mask operation)
+_OPERATIONS = {
+    "union": (np.union1d, np.logical_or),
+    "intersection": (np.intersect1d, np.logical_and),
+    "difference": (np.setdiff1d, lambda m1, m2: m1 & ~m2),
+    "symmetric_difference": (np.setxor1d, np.logical_xor),
+}
+
+def _apply(operation, pts1, pts2, tol):
+    """Apply a set operation to the points encoded as integer keys."""
+    both = np.concatenate((pts1, pts2))
+    if len(both) == 0:
+        return both
+
+    # Floats are already rounded, so scaling makes them exact integers
+    scale = None
+    if both.dtype.kind not in "iu":
+        scale = 10.0 ** tol
+        both = np.rint(both * scale).astype(np.int64)
+    else:
+        both = both.astype(np.int64)
+
+    low = both.min(axis=0)
+    height = int(both[:, 1].max() - low[1]) + 1
+    width = int(both[:, 0].max() - low[0]) + 1
+    keys = (both[:, 0] - low[0]) * height + (both[:, 1] - low[1])
+    keys1, keys2 = keys[:len(pts1)], keys[len(pts1):]
+
+    setop, maskop = _OPERATIONS[operation]
+    if width * height <= metrics.PYRAMID_MAX_CELLS:
+        # Dense keys: combine two occupancy masks over the bounding box
+        mask1 = np.zeros(width * height, dtype=bool)
+        mask2 = np.zeros(width * height, dtype=bool)
+        mask1[keys1] = True
+        mask2[keys2] = True
+        result = np.flatnonzero(maskop(mask1, mask2))
+    else:
+        result = setop(np.unique(keys1), np.unique(keys2))
+    points = np.stack((result // height + low[0], result % height + low[1]), axis=1)
+
+    if scale is not None:
+        return points / scale
+    return points.astype(pts1.dtype)
+
+def _unique(pts, tol):
+    """Distinct points of one array, in key order."""
+    return _apply("union", pts, pts[:0], tol)
 
+def _near(pts, others, radius):
+    """Mask of the points in pts within radius of some point in others."""
+    if len(pts) == 0 or len(others) == 0:
+        return np.zeros(len(pts), dtype=bool)
+    return metrics.nearest_distances(pts, others, bound=radius) <= radius
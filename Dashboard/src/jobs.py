@@ -0,0 +1,120 @@
+# -----------------------------------------------------------------------------
+# jobs.py
+# -----------------------------------------------------------------------------
+# Background execution of dashboard computations.
+#
+# Work runs on a thread pool shared by every session, so independent panels
+# are computed in parallel. Each session submits jobs into named slots (one
+# per panel): a new job for a slot supersedes the previous one, which is
+# cancelled if it has not started and discarded if it has. Jobs submitted in
+# quick succession to the same slot are debounced, so scrubbing a slider
+# only computes the value it settles on. Jobs run in a copy of the submitting
+# context, so they report to the submitter's instrument.collect() block.
+# run_once() starts process-wide work, such as warming the caches after a
+# deploy, the first time any session asks for it.
+#
+# Author: Daniel Cottrell
+# Part of the Farey fractal project.
+# -----------------------------------------------------------------------------
+
+import contextvars
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Defaults, overridable with the FAREY_WORKERS environment variable
+DEFAULT_WORKERS = min(4, os.cpu_count() or 1)
+DEBOUNCE_SECONDS = 0.15
+POLL_SECONDS = 0.05
+
+class Stale(Exception):
+    """A job superseded by a newer one for its slot before it started."""
+
+class JobSlots:
+    """A session's background jobs, at most one current job per slot."""
+
+    def __init__(self, executor=None, debounce=DEBOUNCE_SECONDS):
+        self.executor = executor
+        self.debounce = debounce
+        self._jobs = {}  # slot -> (key, generation, future)
+        self._submitted = {}  # slot -> time of the last submission
+        self._lock = threading.Lock()
+
+    def submit(self, slot, key, compute):
+        """Future for compute(), run in the background as the slot's current job.
+
+        Resubmitting the key of the current job returns its future, so
+        reruns with unchanged parameters do not restart work.
+        """
+        with self._lock:
+            current = self._jobs.get(slot)
+            if current is not None and current[0] == key and not current[2].cancelled():
+                return current[2]
+            if current is not None:
+                current[2].cancel()
+
+            generation = current[1] + 1 if current is not None else 1
+            now = time.monotonic()
+            # Hold the job back while submissions for the slot keep arriving
+            delay = max(0.0, self._submitted.get(slot, -self.debounce) + self.debounce - now)
+            self._submitted[slot] = now
+
+            executor = self.executor or shared_executor()
+            context = contextvars.copy_context()
+            future = executor.submit(context.run, self._run, slot, generation, delay, compute)
+            self._jobs[slot] = (key, generation, future)
+            return future
+
+    def _run(self, slot, generation, delay, compute):
+        if delay:
+            time.sleep(delay)
+        if not self.is_current(slot, generation):
+            raise Stale(slot)
+        return compute()
+
+    def is_current(self, slot, generation):
+        with self._lock:
+            current = self._jobs.get(slot)
+            return current is not None and current[1] == generation
+
+    def cancel(self):
+        """Cancel every job that has not started."""
+        with self._lock:
+            for _, _, future in self._jobs.values():
+                future.cancel()
+            self._jobs.clear()
+
+def as_completed(futures, yield_check=None, poll=POLL_SECONDS):
+    """Yield futures as they finish, calling yield_check between polls.
+
+    yield_check gives the caller a chance to abandon the wait, e.g. by
+    touching Streamlit session state so a pending rerun can interrupt.
+    """
+    pending = set(futures)
+    while pending:
+        done, pending = wait(pending, timeout=poll, return_when=FIRST_COMPLETED)
+        yield from done
+        if pending and yield_check is not None:
+            yield_check()
+
+_shared = None
+_shared_lock = threading.Lock()
+_once = {}
+_once_lock = threading.Lock()
+
+def shared_executor():
+    """Process-wide thread pool, created on first use."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            workers = int(os.environ.get("FAREY_WORKERS", DEFAULT_WORKERS))
+            _shared = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="farey")
+        return _shared
+
+def run_once(name, compute):
+    """Future of compute() on the shared pool, submitted only on the first call for name in this process."""
+    with _once_lock:
+        if name not in _once:
+            _once[name] = shared_executor().submit(compute)
+        return _once[name]
@@ -0,0 +1,153 @@
+# -----------------------------------------------------------------------------
+# katz_index.py
+# -----------------------------------------------------------------------------
+# Precomputed, norm-sorted index of the mirrored Farey points for one
+# (N, origin) pair.
+#
+# The sorted order of the mirrored plane depends only on N and the origin, so
+# it is computed once; the Katz selection for any K is then a prefix of the
+# sorted points found with a binary search.
+#
+# Author: Daniel Cottrell
+# Part of the Farey fractal project.
+# -----------------------------------------------------------------------------
+
+from functools import lru_cache
+import numpy as np
+from src import farey, fractal_corner, fractal_centre, instrument, lines, transforms_corner, transforms_centre
+from src.grid import FractalGrid
+
+# Index points whose line classes are computed at once
+LINE_CLASS_CHUNK = 2**20
+
+# Transform and pipeline modules for each fractal origin
+PIPELINES = {
+    "corner": (transforms_corner, fractal_corner),
+    "centre": (transforms_centre, fractal_centre),
+}
+
+def pipeline(origin):
+    """Transform and fractal modules for an origin name ("corner" or "centre")."""
+    try:
+        return PIPELINES[origin.lower()]
+    except KeyError:
+        raise ValueError(f"Unknown fractal origin: {origin!r}") from None
+
+class KatzIndex:
+    """Mirrored Farey points for one (N, origin), sorted by squared norm."""
+
+    def __init__(self, N, origin="corner", table=None):
+        transforms, _ = pipeline(origin)
+        self.N = N
+        self.origin = origin.lower()
+
+        with instrument.stage("farey", N=N) as record:
+            if table is None:
+                table = farey.shared_table(N)
+            farey_seq = table.prefix(N)
+            record["points"] = len(farey_seq)
+        with instrument.stage("farey_to_grid", origin=self.origin, N=N, points=len(farey_seq)):
+            grid_points = transforms.farey_to_grid(farey_seq)
+        with instrument.stage("generate_full_plane", origin=self.origin, N=N) as record:
+            full_points = transforms.generate_full_plane(grid_points, N)
+            record["points"] = len(full_points)
+        with instrument.stage("sort_points_by_distance", origin=self.origin, N=N, points=len(full_points)):
+            self.points = transforms.sort_points_by_distance(full_points)
+        self.sqd = (self.points ** 2).sum(axis=1)
+        self.max_coordinate = int(np.abs(self.points).max())
+        self._breakpoints = None
+        self._line_classes = None
+
+    def __len__(self):
+        return len(self.points)
+
+    def limit(self, K):
+        """Squared Katz radius for K, rounded exactly as in apply_katz_criterion."""
+        return (np.float64(self.max_coordinate) * K)**2
+
+    def count(self, K):
+        """Number of points kept by the Katz criterion for K."""
+        return int(np.searchsorted(self.sqd, self.limit(K), side="right"))
+
+    def select(self, K):
+        """Points kept by the Katz criterion for K (a view, sorted by distance)."""
+        return self.points[:self.count(K)]
+
+    def breakpoints(self):
+        """Values of K at which the selection grows, in increasing order.
+
+        The selection for any K equals the selection at the largest
+        breakpoint not exceeding it (or is empty below the first one).
+        """
+        if self._breakpoints is None:
+            distinct = np.unique(self.sqd)
+            if self.max_coordinate == 0:
+                self._breakpoints = np.zeros(len(distinct))
+            else:
+                Ks = np.sqrt(distinct) / self.max_coordinate
+                # Correct sqrt and division rounding, which can land just
+                # short of or just past the smallest K admitting sqd
+                for j, sqd in enumerate(distinct):
+                    while self.limit(Ks[j]) < sqd:
+                        Ks[j] = np.nextafter(Ks[j], np.inf)
+                    while Ks[j] > 0 and self.limit(np.nextafter(Ks[j], -np.inf)) >= sqd:
+                        Ks[j] = np.nextafter(Ks[j], -np.inf)
+                self._breakpoints = Ks
+        return self._breakpoints
+
+    def line_classes(self):
+        """Periodic line class of every index point.
+
+        Returns (ids, representatives, periods): the class id of each point,
+        and for each class its first point in index order and the period of
+        its line. Computed for the whole index on first use, a chunk of
+        points at a time.
+        """
+        if self._line_classes is None:
+            keys = np.empty(len(self.points), dtype=np.int64)
+            periods = np.empty(len(self.points), dtype=np.int64)
+            chunk = LINE_CLASS_CHUNK
+            for start in range(0, len(self.points), chunk):
+                keys[start:start + chunk], periods[start:start + chunk] = lines.line_keys(
+                    self.points[start:start + chunk], self.N)
+            _, first, ids = np.unique(keys, return_index=True, return_inverse=True)
+            self._line_classes = (ids.astype(np.int32), self.points[first], periods[first])
+        return self._line_classes
+
+    def canonical_K(self, K):
+        """Smallest K giving the same selection as K."""
+        count = self.count(K)
+        if count == 0:
+            return 0.0
+
+        distinct = np.unique(self.sqd[:count])
+        return float(self.breakpoints()[len(distinct) - 1])
+
+    def generate_fractal_points(self, K):
+        """Fractal points for K, as from the origin's generate_fractal_points."""
+        _, fractal = pipeline(self.origin)
+        selected = self.select(K)
+        with instrument.stage("map_to_periodic_lines", origin=self.origin, N=self.N, K=K, points=len(selected) * self.N):
+            return fractal.map_to_periodic_lines(selected, self.N)
+
+    def generate_fractal_grid(self, K):
+        """Fractal occupancy grid for K.
+
+        The distinct lines of the selection are written straight into the
+        packed grid a band of rows at a time, so memory stays at one bit
+        per cell plus one band.
+        """
+        _, fractal = pipeline(self.origin)
+        directions, periods = lines.distinct_lines(self.select(K), self.N)
+        with instrument.stage("grid", origin=self.origin, N=self.N, K=K, points=int(periods.sum())):
+            grid = FractalGrid(self.N)
+            fractal.fill_grid(grid, directions, self.N)
+            return grid
+
+@lru_cache(maxsize=32)
+def _cached_index(N, origin):
+    return KatzIndex(N, origin)
+
+def get_index(N, origin="corner"):
+    """Shared KatzIndex for (N, origin), built on first use."""
+    return _cached_index(int(N), origin.lower())
@@ -0,0 +1,109 @@
+# -----------------------------------------------------------------------------
+# kernels_numba.py
+# -----------------------------------------------------------------------------
+# Numba-compiled kernels of the "numba" backend (see backends.py).
+#
+# Importing this module requires Numba; backends.py only does so when the
+# backend is requested. The line kernels step along each periodic line with
+# additions modulo N and write cells as they go, so no index arrays are
+# built. Inputs are contiguous int64 arrays with coordinates in [0, N).
+#
+# Author: Daniel Cottrell
+# Part of the Farey fractal project.
+# -----------------------------------------------------------------------------
+
+import numba
+import numpy as np
+
+jit = numba.njit(cache=True, nogil=True)
+
+@jit
+def mirror_plane(grid, reflections, N, offset):
+    """Reflections of grid points, shifted by offset, modulo N."""
+    out = np.empty((grid.shape[0] * reflections.shape[0], 2), dtype=np.int64)
+    k = 0
+    for i in range(grid.shape[0]):
+        for r in range(reflections.shape[0]):
+            out[k, 0] = (grid[i, 0] * reflections[r, 0] + offset) % N
+            out[k, 1] = (grid[i, 1] * reflections[r, 1] + offset) % N
+            k += 1
+    return out
+
+@jit
+def katz_mask(points, limit):
+    """Whether each point's squared norm is within limit."""
+    out = np.empty(points.shape[0], dtype=np.bool_)
+    for i in range(points.shape[0]):
+        out[i] = points[i, 0] * points[i, 0] + points[i, 1] * points[i, 1] <= limit
+    return out
+
+@jit
+def trace_lines(points, periods, N, offset):
+    """Cells of one period of the line through each point."""
+    out = np.empty((periods.sum(), 2), dtype=np.int32)
+    k = 0
+    for j in range(points.shape[0]):
+        b, a = points[j, 0], points[j, 1]
+        x = offset % N
+        y = offset % N
+        for _ in range(periods[j]):
+            out[k, 0] = x
+            out[k, 1] = y
+            k += 1
+            x += b
+            if x >= N:
+                x -= N
+            y += a
+            if y >= N:
+                y -= N
+    return out
+
+@jit
+def fill_lines(mask, points, periods, N, offset):
+    """Set every cell of one period of the line through each point."""
+    for j in range(points.shape[0]):
+        b, a = points[j, 0], points[j, 1]
+        x = offset % N
+        y = offset % N
+        for _ in range(periods[j]):
+            mask[x, y] = True
+            x += b
+            if x >= N:
+                x -= N
+            y += a
+            if y >= N:
+                y -= N
+
+@jit
+def cover_lines(coverage, points, periods, N, offset, delta):
+    """Add delta to every cell of one period of the line through each point."""
+    for j in range(points.shape[0]):
+        b, a = points[j, 0], points[j, 1]
+        x = offset % N
+        y = offset % N
+        for _ in range(periods[j]):
+            coverage[x, y] += delta
+            x += b
+            if x >= N:
+                x -= N
+            y += a
+            if y >= N:
+                y -= N
+
+@jit
+def pyramid_counts(mask, levels):
+    """Occupied cells of mask and of each of levels successive 2 x 2 OR-poolings."""
+    counts = np.zeros(levels + 1, dtype=np.int64)
+    counts[0] = np.count_nonzero(mask)
+    level = mask
+    for k in range(1, levels + 1):
+        pooled = np.zeros(((level.shape[0] + 1) // 2, (level.shape[1] + 1) // 2), dtype=np.bool_)
+        count = 0
+        for i in range(level.shape[0]):
+            for j in range(level.shape[1]):
+                if level[i, j] and not pooled[i >> 1, j >> 1]:
+                    pooled[i >> 1, j >> 1] = True
+                    count += 1
+        counts[k] = count
+        level = pooled
+    return counts
@@ -0,0 +1,115 @@
+# -----------------------------------------------------------------------------
+# lines.py
+# -----------------------------------------------------------------------------
+# Periodic line classes on the N x N torus.
+#
+# The periodic line through a direction (b, a) is the set of multiples
+# i * (b, a) mod N. It repeats after N / gcd(b, a, N) steps, and directions
+# that are multiples of one another by a unit modulo that period trace the
+# same cells. Every line is identified by the Hermite normal form of the
+# lattice it generates together with N Z^2,
+#
+#     [[g, y],
+#      [0, h]],   g = gcd(b, N),  h = (N / g) * gcd(g, a),  0 <= y < h,
+#
+# which gives a key shared by exactly the directions tracing the same line.
+# Line mapping traces each distinct line once, over a single period, and
+# fill_grid writes lines into a packed grid row by row from this form.
+#
+# Author: Daniel Cottrell
+# Part of the Farey fractal project.
+# -----------------------------------------------------------------------------
+
+import numpy as np
+
+# Cells of the dense band mask, and of each block of cells, used by fill_grid
+FILL_BAND_CELLS = 2**24
+FILL_CHUNK_CELLS = 2**22
+
+def line_keys(points, N):
+    """Integer key and period of the periodic line through each point.
+
+    Two points share a key exactly when their lines are the same set of
+    cells. Returns (keys, periods) as int64 arrays.
+    """
+    pts = np.asarray(points, dtype=np.int64).reshape(-1, 2) % N
+    g, y, h = hermite_forms(pts, N)
+    periods = N // np.gcd(np.gcd(pts[:, 0], pts[:, 1]), N)
+    return (g * (N + 1) + y) * (N + 1) + h, periods
+
+def hermite_forms(points, N):
+    """(g, y, h) of the Hermite normal form of the line through each point, as int64 arrays."""
+    pts = np.asarray(points, dtype=np.int64).reshape(-1, 2) % N
+    b, a = pts[:, 0], pts[:, 1]
+
+    # g = gcd(b, N) and s with s * b = g (mod N), so the lattice holds (g, s * a)
+    g, s = _extended_gcd(b, N)
+    h = (N // g) * np.gcd(g, a)
+    return g, (s * a) % h, h
+
+def distinct_lines(points, N):
+    """First point on each distinct line, in input order, and the period of its line."""
+    pts = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+    keys, periods = line_keys(pts, N)
+    _, first = np.unique(keys, return_index=True)
+    first.sort()
+    return pts[first], periods[first]
+
+def trace_lines(points, periods, N, offset=0):
+    """Cells i * point + offset mod N for i in 0 .. period - 1 of each point, as an (M, 2) int32 array.
+
+    Lines are emitted grouped by period, which takes few distinct values
+    (divisors of N).
+    """
+    pts = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+    periods = np.asarray(periods, dtype=np.int64)
+
+    cells = np.empty((int(periods.sum()), 2), dtype=np.int32)
+    start = 0
+    for period in np.unique(periods):
+        group = pts[periods == period]
+        steps = np.arange(period, dtype=np.int64)
+        end = start + len(group) * int(period)
+        cells[start:end, 0] = ((np.outer(group[:, 0], steps) + offset) % N).ravel()
+        cells[start:end, 1] = ((np.outer(group[:, 1], steps) + offset) % N).ravel()
+        start = end
+    return cells
+
+def fill_grid(grid, points, N, offset=0):
+    """Mark one period of the line through each point, shifted by offset, in an N x N FractalGrid.
+
+    By its Hermite normal form, the line meets row x = k * g (mod N) in the
+    cells y = k * y + l * h for every l, and no other row. Each band of
+    rows is filled from this as a dense mask of FILL_BAND_CELLS cells and
+    packed into the grid, so no cell list is built or sorted.
+    """
+    g, y, h = hermite_forms(points, N)
+    forms = np.stack((g, h), axis=1)
+    groups = np.unique(forms, axis=0) if len(forms) else forms
+
+    for start, rows in grid.bands(max(1, FILL_BAND_CELLS // max(N, 1))):
+        band = np.zeros((len(rows), N), dtype=bool)
+        x = (np.arange(start, start + len(rows), dtype=np.int64) - offset) % N
+        for g_value, h_value in groups:
+            on = np.flatnonzero(x % g_value == 0)
+            if len(on) == 0:
+                continue
+            k = x[on] // g_value
+            steps = np.arange(0, N, h_value, dtype=np.int64) + offset
+            slopes = y[(g == g_value) & (h == h_value)]
+            per_chunk = max(1, FILL_CHUNK_CELLS // (len(on) * len(steps)))
+            for first in range(0, len(slopes), per_chunk):
+                cells = (np.multiply.outer(k, slopes[first:first + per_chunk])[:, :, None] + steps) % N
+                band[on[:, None, None], cells] = True
+        rows[...] = np.packbits(band, axis=1)
+
+def _extended_gcd(values, N):
+    """(gcd(v, N), s) elementwise, with s * v = gcd(v, N) (mod N)."""
+    old_r, r = values % N, np.full(len(values), N, dtype=np.int64)
+    old_s, s = np.ones(len(values), dtype=np.int64), np.zeros(len(values), dtype=np.int64)
+    while r.any():
+        active = r != 0
+        q = np.where(active, old_r // np.where(active, r, 1), 0)
+        old_r, r = np.where(active, r, old_r), np.where(active, old_r - q * r, r)
+        old_s, s = np.where(active, s, old_s), np.where(active, old_s - q * s, s)
+    return old_r, old_s
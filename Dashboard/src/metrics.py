@@ -2,36 +2,102 @@
 # metrics.py
 # -----------------------------------------------------------------------------
 # Mathematical metrics for Farey-based fractals:
-#   - Box-counting fractal dimension
-#   - Hausdorff distance between two fractals
+#   - Box-counting fractal dimension (single-pass occupancy pyramid)
+#   - Hausdorff distance between two fractals (distance transform or KD-tree)
+#
+# SciPy is imported on first use by the distance functions, so importing this
+# module for box-counting stays cheap.
 #
 # Author: Daniel Cottrell
 # Part of the Farey fractal project.
 # -----------------------------------------------------------------------------
 
 import numpy as np
-from scipy.spatial.distance import cdist
 from math import log2
+from src import backends, instrument
+from src.grid import FractalGrid
+
+# Largest occupancy mask (in cells) built from raw points for the pyramid
+PYRAMID_MAX_CELLS = 2**26
 
 # Fractal Dimension
+@instrument.timed("fractal_dimension")
 def fractal_dimension(points, box_sizes=None):
     """Estimates the fractal dimension using box-counting."""
-    if not points:
+    return dimension_from_counts(*box_counts(points, box_sizes))
+
+def dimension_from_counts(box_sizes, counts):
+    """Box-counting dimension from the occupied-box counts at each size."""
+    if not counts:
         return 0.0
-    
-    pts = np.array(points)
-    N = max(pts.max(), abs(pts.min()))
+
+    return _slope(box_sizes, counts)
+
+def box_counts(points, box_sizes=None):
+    """Number of occupied boxes for each box size.
+
+    Returns (box_sizes, counts). By default the sizes are the powers of two
+    up to the largest coordinate. Integer points and occupancy grids are
+    counted from an OR-pooled occupancy pyramid built in a single pass;
+    other inputs or box sizes fall back to counting integer-encoded box keys.
+    Memory-mapped grids, and grids too large to unpack, are pooled band by
+    band from their packed rows.
+    """
+    mask = None
+    if isinstance(points, FractalGrid):
+        N = points.max_coordinate()
+        if N < 0:
+            return box_sizes, []
+        if box_sizes is None:
+            box_sizes = [2 ** k for k in range(1, int(log2(N)) + 1)] if N > 0 else []
+        if _powers_of_two(box_sizes) and (points.is_memmap or points.N**2 > PYRAMID_MAX_CELLS):
+            levels = [int(size).bit_length() - 1 for size in box_sizes]
+            counts = points.pyramid_counts(max(levels, default=0))
+            return box_sizes, [counts[level] for level in levels]
+        mask = points.mask
+        pts = None
+    else:
+        pts = np.asarray(points).reshape(-1, 2)
+        if len(pts) == 0:
+            return box_sizes, []
+        N = max(pts.max(), abs(pts.min()))
+        if pts.dtype.kind in "iu" and pts.min() >= 0 and (N + 1)**2 <= PYRAMID_MAX_CELLS:
+            mask = np.zeros((N + 1, N + 1), dtype=bool)
+            mask[pts[:, 0], pts[:, 1]] = True
 
     if box_sizes is None:
         box_sizes = [2 ** k for k in range(1, int(log2(N)) + 1)]
 
-    counts = []
-    for size in box_sizes:
-        # Place points into grid of "boxes"
-        grid = np.floor(pts / size).astype(int)
-        unique_boxes = {tuple(g) for g in grid}
-        counts.append(len(unique_boxes))
+    if mask is not None and _powers_of_two(box_sizes):
+        return box_sizes, _pyramid_counts(mask, box_sizes)
 
+    if pts is None:
+        pts = np.argwhere(mask)
+    return box_sizes, [_encoded_count(pts, size) for size in box_sizes]
+
+def _powers_of_two(box_sizes):
+    return all(int(size) == size and size >= 1 and int(size) & (int(size) - 1) == 0
+               for size in box_sizes)
+
+def _pyramid_counts(mask, box_sizes):
+    """Box counts for power-of-two sizes read from one occupancy pyramid."""
+    levels = [int(size).bit_length() - 1 for size in box_sizes]
+    counts = backends.current().pyramid_counts(mask, max(levels, default=0))
+    return [counts[level] for level in levels]
+
+def _encoded_count(pts, size):
+    """Number of distinct boxes of the given size, via integer box keys."""
+    boxes = np.floor(pts / size).astype(np.int64)
+    boxes -= boxes.min(axis=0)
+    height = int(boxes[:, 1].max()) + 1
+    keys = boxes[:, 0] * height + boxes[:, 1]
+
+    if keys.max() < 8 * len(keys):
+        return int(np.count_nonzero(np.bincount(keys)))
+    return len(np.unique(keys))
+
+def _slope(box_sizes, counts):
+    """Slope of log(count) against -log(size)."""
     logsizes = -np.log(box_sizes)
     logcounts = np.log(counts)
 
@@ -41,20 +107,117 @@ def fractal_dimension(points, box_sizes=None):
 
 
 # Hausdorff Distance
-def fractal_distance(points1, points2):
-    """Computes the distance between two fractals."""
+@instrument.timed("fractal_distance")
+def fractal_distance(points1, points2, N=None, toroidal=False, bound=None):
+    """Computes the distance between two fractals.
 
-    if not points1 or not points2:
+    Integer points and grids use an exact Euclidean distance transform of
+    each occupancy mask; other inputs use a KD-tree. With toroidal=True
+    distances wrap around the N x N torus (N defaults to the grid size).
+    If bound is given, inf is returned as soon as the distance is known to
+    exceed it.
+    """
+    A = _as_points(points1)
+    B = _as_points(points2)
+    if len(A) == 0 or len(B) == 0:
         return float("inf")
-    
-    A = np.array(points1)
-    B = np.array(points2)
 
-    d_AB = np.max(np.min(cdist(A, B), axis=1))
-    d_BA = np.max(np.min(cdist(B, A), axis=1))
+    if toroidal:
+        N = _torus_size(N, points1, points2)
+
+    d_AB = float(nearest_distances(A, B, N, toroidal, bound).max())
+    if bound is not None and d_AB > bound:
+        return float("inf")
+    d_BA = float(nearest_distances(B, A, N, toroidal, bound).max())
+    if bound is not None and d_BA > bound:
+        return float("inf")
     return max(d_AB, d_BA)
-    
 
+def nearest_distances(points, others, N=None, toroidal=False, bound=None):
+    """Distance from each point to its nearest neighbour in others.
+
+    Uses an exact distance transform of the occupancy mask of others for
+    integer inputs, and a KD-tree otherwise. With bound given, distances
+    beyond it may be reported as inf.
+    """
+    A = _as_points(points)
+    B = _as_points(others)
+    if toroidal:
+        N = _torus_size(N, points, others)
+    else:
+        N = None
+
+    if len(B) == 0:
+        return np.full(len(A), np.inf)
+    if len(A) == 0:
+        return np.zeros(0)
+
+    integer = A.dtype.kind in "iu" and B.dtype.kind in "iu"
+    if integer and _edt_fits(A, B, N):
+        return _nearest_edt(A, B, N)
+    return _nearest_kdtree(A, B, N, bound)
+
+def _torus_size(N, *fractals):
+    """N if given, else the size of the first FractalGrid among fractals."""
+    for fractal in fractals:
+        N = N or _grid_size(fractal)
+    if N is None:
+        raise ValueError("toroidal distances need the grid size N")
+    return N
+
+def _edt_fits(A, B, N):
+    """Whether the distance-transform mask stays within PYRAMID_MAX_CELLS."""
+    if N is not None:
+        side = N + 2 * ((N + 1) // 2)
+        return side * side <= PYRAMID_MAX_CELLS
+    both = np.concatenate((A, B))
+    extent = both.max(axis=0).astype(np.int64) - both.min(axis=0) + 1
+    return int(extent[0]) * int(extent[1]) <= PYRAMID_MAX_CELLS
+
+def _nearest_edt(A, B, N):
+    """Nearest-neighbour distances read from a distance transform of B's mask."""
+    if N is None:
+        origin = np.minimum(A.min(axis=0), B.min(axis=0))
+        A = A.astype(np.int64) - origin
+        B = B.astype(np.int64) - origin
+        shape = tuple(np.maximum(A.max(axis=0), B.max(axis=0)) + 1)
+        pad = 0
+    else:
+        # Wrap the mask by half a period on every side so each cell sees its
+        # nearest neighbour on the torus
+        A = A.astype(np.int64) % N
+        B = B.astype(np.int64) % N
+        shape = (N, N)
+        pad = (N + 1) // 2
+
+    from scipy import ndimage
+    free = np.ones(shape, dtype=bool)
+    free[B[:, 0], B[:, 1]] = False
+    if pad:
+        free = np.pad(free, pad, mode="wrap")
+
+    distances = ndimage.distance_transform_edt(free)
+    return distances[A[:, 0] + pad, A[:, 1] + pad]
+
+def _nearest_kdtree(A, B, N, bound=None):
+    """Nearest-neighbour distances from a KD-tree query."""
+    from scipy.spatial import cKDTree
+    if N is not None:
+        tree = cKDTree(np.mod(B, N), boxsize=N)
+        A = np.mod(A, N)
+    else:
+        tree = cKDTree(B)
 
+    upper = np.inf if bound is None else np.nextafter(bound, np.inf)
+    distances, _ = tree.query(A, k=1, distance_upper_bound=upper)
+    return distances
 
+def _grid_size(points):
+    """N of a FractalGrid, or None for plain points."""
+    return points.N if isinstance(points, FractalGrid) else None
 
+def _as_points(points):
+    """Coerce a point array or FractalGrid to an (M, 2) array."""
+    if isinstance(points, FractalGrid):
+        return points.to_points()
+    return np.asarray(points).reshape(-1, 2)
@@ -0,0 +1,133 @@
+# -----------------------------------------------------------------------------
+# parallel.py
+# -----------------------------------------------------------------------------
+# Multi-process generation of a single large fractal.
+#
+# The selected directions are split across worker processes, balanced by the
+# number of cells their lines cover. Inputs and outputs live in shared memory
+# (multiprocessing.shared_memory): each worker attaches to the blocks by name
+# and writes its lines in place, so no point lists are pickled between
+# processes.
+#   - periodic_points: every worker fills its own rows of the (M, 2) point
+#                      array, so the result equals map_to_periodic_lines
+#   - occupancy_mask:  every worker marks its lines' cells in one shared
+#                      (N, N) byte mask. Workers only ever store True, so
+#                      overlapping lines merge as an OR without locks.
+#
+# Used through the workers argument of generate_fractal_points and
+# generate_fractal_grid in fractal_corner and fractal_centre.
+#
+# Author: Daniel Cottrell
+# Part of the Farey fractal project.
+# -----------------------------------------------------------------------------
+
+import importlib
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+
+def periodic_points(selected, N, origin, workers=None):
+    """map_to_periodic_lines(selected, N) of an origin's pipeline, computed by worker processes."""
+    selected = np.ascontiguousarray(np.asarray(selected, dtype=np.int64).reshape(-1, 2))
+    parts = _partition(np.full(len(selected), N), workers)
+    with _Shared(selected) as directions, _Shared.empty((len(selected) * N, 2), np.int32) as out:
+        _run(_points_worker, origin, N, parts, directions.spec, out.spec)
+        return out.array.copy()
+
+def occupancy_mask(directions, periods, N, origin, workers=None):
+    """(N, N) bool mask of one period of the lines through directions, filled by worker processes.
+
+    directions and periods are as returned by lines.distinct_lines.
+    """
+    directions = np.ascontiguousarray(np.asarray(directions, dtype=np.int64).reshape(-1, 2))
+    periods = np.ascontiguousarray(periods, dtype=np.int64)
+    parts = _partition(periods, workers)
+    with _Shared(directions) as shared_directions, _Shared(periods) as shared_periods, \
+            _Shared.empty((N, N), np.bool_) as mask:
+        mask.array[:] = False
+        _run(_lines_worker, origin, N, parts, shared_directions.spec, shared_periods.spec, mask.spec)
+        return mask.array.copy()
+
+def _run(worker, origin, N, parts, *specs):
+    """Call worker(origin, N, start, stop, *specs) for every part, in a process pool when there are several."""
+    if len(parts) == 1:
+        worker(origin, N, *parts[0], *specs)
+        return
+    with ProcessPoolExecutor(max_workers=len(parts)) as pool:
+        futures = [pool.submit(worker, origin, N, start, stop, *specs) for start, stop in parts]
+        for future in futures:
+            future.result()
+
+def _partition(cells, workers):
+    """Contiguous (start, stop) ranges of items, one per worker, covering about equal cells."""
+    workers = max(1, min(workers or os.cpu_count() or 1, len(cells)))
+    total = np.cumsum(cells)
+    bounds = np.searchsorted(total, total[-1] * np.arange(1, workers) / workers) if len(cells) else []
+    bounds = [0, *sorted(set(int(b) for b in bounds) - {0, len(cells)}), len(cells)]
+    return list(zip(bounds[:-1], bounds[1:]))
+
+def _points_worker(origin, N, start, stop, directions_spec, out_spec):
+    fractal = importlib.import_module(f"src.fractal_{origin}")
+    directions, out = _Shared.attach(directions_spec), _Shared.attach(out_spec)
+    try:
+        step = max(1, fractal.CHUNK_POINTS // max(N, 1))
+        for lo in range(start, stop, step):
+            hi = min(lo + step, stop)
+            out.array[lo * N:hi * N] = fractal.map_to_periodic_lines(directions.array[lo:hi], N)
+    finally:
+        directions.close()
+        out.close()
+
+def _lines_worker(origin, N, start, stop, directions_spec, periods_spec, mask_spec):
+    fractal = importlib.import_module(f"src.fractal_{origin}")
+    directions, periods = _Shared.attach(directions_spec), _Shared.attach(periods_spec)
+    mask = _Shared.attach(mask_spec)
+    try:
+        fractal.fill_lines(mask.array, directions.array[start:stop], periods.array[start:stop], N)
+    finally:
+        directions.close()
+        periods.close()
+        mask.close()
+
+class _Shared:
+    """An array in a shared-memory block, unlinked when the creating context exits."""
+
+    def __init__(self, array=None, shape=None, dtype=None, name=None):
+        if array is not None:
+            shape, dtype = array.shape, array.dtype
+        self.dtype = np.dtype(dtype)
+        size = max(1, int(np.prod(shape)) * self.dtype.itemsize)
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            # Workers share the creating process's resource tracker, which
+            # forgets the block when the creator unlinks it
+            self.memory = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.array = np.ndarray(shape, dtype=self.dtype, buffer=self.memory.buf)
+        self.spec = (self.memory.name, tuple(shape), self.dtype.str)
+        if array is not None:
+            self.array[...] = array
+
+    @classmethod
+    def empty(cls, shape, dtype):
+        return cls(shape=shape, dtype=dtype)
+
+    @classmethod
+    def attach(cls, spec):
+        name, shape, dtype = spec
+        return cls(shape=shape, dtype=dtype, name=name)
+
+    def close(self):
+        self.array = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,18 +1,43 @@
 # -----------------------------------------------------------------------------
 # plotting.py
 # -----------------------------------------------------------------------------
-# Function for plotting fractal points using matplotlib.
-# 
+# Functions for plotting fractal points using matplotlib.
+#
+# Every fractal point is an integer cell of an N x N grid, so figures are
+# rasterised: occupancy is painted straight into an RGB image and shown with
+# imshow, rather than drawing one scatter marker per point. Point sizes are
+# converted to a dilation radius in cells so the result keeps the look of
+# the scatter plots it replaces. Very large fractals are drawn a window at a
+# time from a tiles.TilePyramid.
+#
+# Figures are created directly rather than through pyplot, whose global
+# figure registry is not safe to use from the dashboard's worker threads.
+# matplotlib is imported on first use, so importing this module is cheap.
+#
 # Author: Daniel Cottrell
 # Part of the Farey fractal project.
 # -----------------------------------------------------------------------------
 
-import matplotlib.pyplot as plt
+import io
+import numpy as np
+from src import instrument
+from src.grid import FractalGrid
 
+FIGSIZE = (8, 8)
+DPI = 200
+
+# Width of the default axes in points (matplotlib leaves 77.5% of the figure)
+# and in pixels once saved at DPI
+_AXES_WIDTH_PT = 0.775 * FIGSIZE[0] * 72
+_AXES_PIXELS = int(_AXES_WIDTH_PT / 72 * DPI)
+
+@instrument.timed("plot_fractal")
 def plot_fractal(points, N, K, point_size=0.5, origin="corner", inverse=False):
-    """Plot fractal using scatter plot."""
-    x_vals, y_vals = zip(*points) if points else ([], [])
-    fig, ax = plt.subplots(figsize=(8, 8))
+    """Plot fractal as a raster image."""
+    grid = _as_grid(points, N)
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=FIGSIZE)
+    ax = fig.subplots()
 
     fig.patch.set_facecolor('white')
 
@@ -21,13 +46,156 @@ def plot_fractal(points, N, K, point_size=0.5, origin="corner", inverse=False):
     ax_bg = 'white' if not inverse else 'black'
 
     ax.set_facecolor(ax_bg)
-    ax.scatter(
-        x_vals, y_vals,
-        s=point_size, marker="o",
-        color=point_color
-    )
+    mask, cells_per_pixel = raster_mask(grid, point_size)
+    _show(ax, composite([(mask, point_color, 1.0)], ax_bg), grid.N, cells_per_pixel)
+
+    return fig
+
+@instrument.timed("plot_overlay")
+def plot_overlay(points1, points2, point_size1=0.5, point_size2=0.5):
+    """Plot two fractals on shared axes, A in red and B in blue."""
+    grid1, grid2 = _as_grid(points1), _as_grid(points2)
+    N = max(grid1.N, grid2.N)
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=FIGSIZE)
+    ax = fig.subplots()
+
+    mask1, cells_per_pixel = raster_mask(grid1, point_size1, N)
+    mask2, _ = raster_mask(grid2, point_size2, N)
+    _show(ax, composite([(mask1, "red", 0.6), (mask2, "blue", 0.6)]), N, cells_per_pixel)
+
+    from matplotlib.patches import Patch
+    handles = []
+    if grid1.count():
+        handles.append(Patch(color="red", alpha=0.6, label="Fractal A"))
+    if grid2.count():
+        handles.append(Patch(color="blue", alpha=0.6, label="Fractal B"))
+    if handles:
+        ax.legend(handles=handles)
+
+    return fig
+
+@instrument.timed("plot_points")
+def plot_points(points, point_size=0.5, color="black"):
+    """Plot a set of points in a single colour."""
+    grid = _as_grid(points)
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=FIGSIZE)
+    ax = fig.subplots()
+
+    mask, cells_per_pixel = raster_mask(grid, point_size)
+    _show(ax, composite([(mask, color, 1.0)]), grid.N, cells_per_pixel)
+
+    return fig
+
+@instrument.timed("plot_tiles")
+def plot_tiles(pyramid, x0, x1, y0, y1, inverse=False):
+    """Plot the window [x0, x1) x [y0, y1) of a fractal from its tiles.TilePyramid.
 
+    Pixels are shaded by the fraction of occupied cells beneath them when
+    the pyramid counts cells, and drawn solid when it max-pools.
+    """
+    from matplotlib.figure import Figure
+    fig = Figure(figsize=FIGSIZE)
+    ax = fig.subplots()
+
+    point_color = 'black' if not inverse else 'white'
+    ax_bg = 'white' if not inverse else 'black'
+    ax.set_facecolor(ax_bg)
+
+    view, (left, right, bottom, top) = pyramid.view(x0, x1, y0, y1, _AXES_PIXELS)
+    density = view.T[..., None] / max(int(view.max(initial=0)), 1)
+    image = np.rint(_rgb(ax_bg) + density * (_rgb(point_color) - _rgb(ax_bg))).astype(np.uint8)
+    ax.imshow(image, origin="lower", extent=(left - 0.5, right - 0.5, bottom - 0.5, top - 0.5),
+              interpolation="nearest")
+    ax.set_xlim(x0 - 0.5, x1 - 0.5)
+    ax.set_ylim(y0 - 0.5, y1 - 0.5)
     ax.set_aspect("equal")
 
     return fig
 
+def raster_mask(grid, point_size, N=None):
+    """Occupancy of a grid rasterised at display resolution, with cells drawn as scatter markers.
+
+    The grid is zero-padded to N x N when N is given. Grids narrower than the
+    saved axes get a block of pixels per cell with the marker at its centre;
+    wider grids are pooled so each pixel covers several cells. Returns the
+    pixel mask, indexed [x, y], and the number of cells per pixel.
+    """
+    if N is not None and N != grid.N:
+        grid = FractalGrid(N) | grid
+    if grid.N <= _AXES_PIXELS:
+        block = _AXES_PIXELS // grid.N
+        canvas = np.zeros((grid.N * block, grid.N * block), dtype=bool)
+        canvas[block // 2::block, block // 2::block] = grid.mask
+        pixels, cells_per_pixel = FractalGrid.from_mask(canvas), 1 / block
+    else:
+        cells_per_pixel = -(-grid.N // _AXES_PIXELS)
+        pixels = FractalGrid.from_mask(grid.pooled(cells_per_pixel))
+
+    # Markers smaller than a pixel still cover the pixel they fall in
+    radius = marker_radius(point_size, grid.N) / cells_per_pixel
+    if radius >= 1:
+        pixels = pixels.dilate(radius)
+    return pixels.mask, cells_per_pixel
+
+def marker_radius(point_size, N):
+    """Radius in cells of a scatter marker of size point_size (points^2) on an N-cell axis.
+
+    Scatter markers are stroked with an edge of the default line width, so
+    they are drawn that much wider than sqrt(point_size).
+    """
+    from matplotlib import rcParams
+    diameter = np.sqrt(point_size) + rcParams["lines.linewidth"]
+    return diameter / 2 / (_AXES_WIDTH_PT / N)
+
+def composite(layers, background="white"):
+    """8-bit RGB image of (mask, colour, alpha) layers painted in order over a background.
+
+    Masks are indexed [x, y]; the image is transposed so y runs up the rows.
+    Each cell is coloured by a lookup on which layers cover it.
+    """
+    code = np.zeros(layers[0][0].shape, dtype=np.uint8)
+    for i, (mask, _, _) in enumerate(layers):
+        code |= mask.astype(np.uint8) << i
+
+    from matplotlib.colors import to_rgb
+    palette = np.empty((2 ** len(layers), 3))
+    for combination in range(len(palette)):
+        colour = np.array(to_rgb(background))
+        for i, (_, color, alpha) in enumerate(layers):
+            if combination >> i & 1:
+                colour = (1 - alpha) * colour + alpha * np.array(to_rgb(color))
+        palette[combination] = colour
+    return np.rint(palette * 255).astype(np.uint8)[code.T]
+
+@instrument.timed("figure_png")
+def figure_png(fig):
+    """Render a figure to PNG bytes the way st.pyplot does."""
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", bbox_inches="tight", dpi=DPI)
+    return buffer.getvalue()
+
+def _rgb(color):
+    from matplotlib.colors import to_rgb
+    return np.array(to_rgb(color)) * 255
+
+def _show(ax, image, N, cells_per_pixel=1):
+    """Draw a raster of an N x N grid whose cells are centred on integer coordinates."""
+    from matplotlib import rcParams
+    edge = image.shape[0] * cells_per_pixel - 0.5
+    ax.imshow(image, origin="lower", extent=(-0.5, edge, -0.5, edge), interpolation="nearest")
+    # Leave the margin that autoscaling gives a scatter plot of the same cells
+    margin = rcParams["axes.xmargin"] * (N - 1)
+    ax.set_xlim(-margin - 0.5, N - 0.5 + margin)
+    ax.set_ylim(-margin - 0.5, N - 0.5 + margin)
+    ax.set_aspect("equal")
+
+def _as_grid(points, N=None):
+    """Coerce a FractalGrid or an (M, 2) array of cells in [0, N) to a FractalGrid."""
+    if isinstance(points, FractalGrid):
+        return points
+    pts = np.rint(np.asarray(points, dtype=np.float64).reshape(-1, 2)).astype(np.int64)
+    if N is None:
+        N = int(pts.max()) + 1 if len(pts) else 1
+    return FractalGrid.from_points(pts, N)
@@ -0,0 +1,141 @@
+# -----------------------------------------------------------------------------
+# sinks.py
+# -----------------------------------------------------------------------------
+# Incremental consumers for fractals streamed in chunks of points.
+#
+# The streaming pipelines (stream_fractal_points in fractal_corner and
+# fractal_centre) yield a fractal as (M, 2) chunks, so it never has to be
+# held whole. Each sink folds chunks into a bounded amount of state:
+#   - GridSink:      the occupancy grid, one bit per cell
+#   - BoxCountSink:  occupied boxes at every power-of-two size, for the
+#                    box-counting dimension
+#   - NpySink:       every point, appended to a .npy file on disk
+#   - CountSink:     running point, distinct cell and duplicate counts
+#
+# Usage:
+#   grid, boxes = sinks.consume(fractal_corner.stream_fractal_points(N, K),
+#                               sinks.GridSink(N), sinks.BoxCountSink(N))
+#
+# Author: Daniel Cottrell
+# Part of the Farey fractal project.
+# -----------------------------------------------------------------------------
+
+import struct
+from math import log2
+import numpy as np
+from src import metrics
+from src.grid import FractalGrid
+
+# Bytes reserved for the header of .npy files written by NpySink
+NPY_HEADER_BYTES = 128
+
+def consume(chunks, *sinks):
+    """Feed every chunk to every sink, then return each sink's result in order."""
+    for chunk in chunks:
+        for sink in sinks:
+            sink.add(chunk)
+    return tuple(sink.result() for sink in sinks)
+
+class GridSink:
+    """Accumulates chunks into a FractalGrid."""
+
+    def __init__(self, N):
+        self.grid = FractalGrid(N)
+
+    def add(self, chunk):
+        self.grid.add_points(chunk)
+
+    def result(self):
+        return self.grid
+
+class BoxCountSink:
+    """Online box-count pyramid: the occupied boxes of each power-of-two size.
+
+    Level k holds one bit per 2^k x 2^k box, so the pyramid uses about a
+    third of the memory of the grid itself. The result matches
+    metrics.box_counts on the finished fractal.
+    """
+
+    def __init__(self, N):
+        self.N = N
+        self.levels = [FractalGrid(-(-N // 2**k)) for k in range(1, int(log2(max(N - 1, 1))) + 1)]
+        self.max_coordinate = -1
+
+    def add(self, chunk):
+        pts = np.asarray(chunk).reshape(-1, 2).astype(np.int64) % self.N
+        if len(pts) == 0:
+            return
+        self.max_coordinate = max(self.max_coordinate, int(pts.max()))
+        for level in self.levels:
+            # Boxes of the level below, halved and deduplicated, so each
+            # level works on fewer points than the last
+            pts = _distinct(pts >> 1, level.N)
+            level.add_points(pts)
+
+    def result(self):
+        """(box_sizes, counts) for the powers of two up to the largest coordinate."""
+        if self.max_coordinate < 0:
+            return None, []
+        top = int(log2(self.max_coordinate)) if self.max_coordinate > 0 else 0
+        box_sizes = [2 ** k for k in range(1, top + 1)]
+        return box_sizes, [self.levels[k - 1].count() for k in range(1, top + 1)]
+
+    def dimension(self):
+        """Box-counting dimension of the fractal consumed so far."""
+        return metrics.dimension_from_counts(*self.result())
+
+def _distinct(pts, N):
+    """Distinct rows of an (M, 2) array of points in [0, N)."""
+    keys = np.sort(pts[:, 0] * N + pts[:, 1])
+    keys = keys[np.r_[True, keys[1:] != keys[:-1]]]
+    return np.stack(np.divmod(keys, N), axis=1)
+
+class NpySink:
+    """Appends chunks to an (M, 2) .npy file, readable with np.load or np.load(mmap_mode="r")."""
+
+    def __init__(self, path, dtype=np.int32):
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.rows = 0
+        self.file = open(path, "wb")
+        self._write_header()
+
+    def add(self, chunk):
+        pts = np.ascontiguousarray(np.asarray(chunk).reshape(-1, 2), dtype=self.dtype)
+        self.file.write(pts.tobytes())
+        self.rows += len(pts)
+
+    def result(self):
+        """Write the final shape into the header, close the file and return its path."""
+        self.file.seek(0)
+        self._write_header()
+        self.file.close()
+        return self.path
+
+    def _write_header(self):
+        header = repr({"descr": np.lib.format.dtype_to_descr(self.dtype),
+                       "fortran_order": False, "shape": (self.rows, 2)})
+        # Pad so the data starts at the same offset however many rows follow
+        prefix = np.lib.format.magic(1, 0)
+        header = header.ljust(NPY_HEADER_BYTES - len(prefix) - 3) + "\n"
+        self.file.write(prefix + struct.pack("<H", len(header)) + header.encode("latin1"))
+
+class CountSink:
+    """Running counts of points, distinct cells and points landing on an occupied cell."""
+
+    def __init__(self, N):
+        self.seen = FractalGrid(N)
+        self.points = 0
+        self.distinct = 0
+
+    @property
+    def duplicates(self):
+        return self.points - self.distinct
+
+    def add(self, chunk):
+        pts = np.asarray(chunk).reshape(-1, 2)
+        self.points += len(pts)
+        self.distinct += self.seen.add_points(pts)
+
+    def result(self):
+        return {"points": self.points, "distinct": self.distinct, "duplicates": self.duplicates}
@@ -0,0 +1,239 @@
+# -----------------------------------------------------------------------------
+# store.py
+# -----------------------------------------------------------------------------
+# Persistent on-disk store for generated fractals and their metrics.
+#
+# Each entry is a directory holding the bit-packed occupancy mask and the
+# Katz-selected points as .npy files, plus a small JSON manifest with the
+# parameters and any computed metrics. Arrays are loaded memory-mapped, so a
+# warm start only pages in the data it touches.
+#
+# Entries are keyed by (N, Katz prefix length, origin, code version): every K
+# between two breakpoints shares an entry, and bumping CODE_VERSION retires
+# entries written by an older generator. The store is capped in bytes and
+# evicts the least recently used entries first.
+#
+# Usage:
+#   python -m src.store prefill --N 257 500 --K 0.1 0.2 0.5 --origin corner centre
+#   python -m src.store info
+#
+# Author: Daniel Cottrell
+# Part of the Farey fractal project.
+# -----------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+import shutil
+import tempfile
+import threading
+import numpy as np
+from src import incremental, katz_index, metrics
+from src.grid import FractalGrid
+
+# Bump whenever generation changes in a way that alters stored fractals
+CODE_VERSION = 1
+
+DEFAULT_ROOT = os.path.join(os.path.expanduser("~"), ".cache", "farey_fractals")
+DEFAULT_MAX_BYTES = 2 * 2**30
+
+MANIFEST = "manifest.json"
+
+class StoredFractal:
+    """A fractal loaded from the store; arrays are read-only memory maps."""
+
+    def __init__(self, grid, selected, manifest):
+        self.grid = grid
+        self.selected = selected
+        self.manifest = manifest
+
+    @property
+    def metrics(self):
+        return self.manifest.setdefault("metrics", {})
+
+class FractalStore:
+    """Directory of stored fractals, capped at max_bytes."""
+
+    def __init__(self, root=DEFAULT_ROOT, max_bytes=DEFAULT_MAX_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+
+    def key(self, N, K, origin):
+        """Canonical (N, prefix length, origin, version) key for a fractal."""
+        index = katz_index.get_index(N, origin)
+        return (int(N), index.count(K), index.origin, CODE_VERSION)
+
+    def _path(self, key):
+        N, count, origin, version = key
+        return os.path.join(self.root, f"{origin}_N{N}_n{count}_v{version}")
+
+    def load(self, N, K, origin):
+        """Stored fractal for (N, K, origin), or None if absent."""
+        path = self._path(self.key(N, K, origin))
+        try:
+            with open(os.path.join(path, MANIFEST)) as f:
+                manifest = json.load(f)
+            bits = _load_array(os.path.join(path, "mask.npy"))
+            selected = _load_array(os.path.join(path, "selected.npy"))
+            # The manifest's modification time records the last access; an
+            # entry evicted since it was read is a miss
+            os.utime(os.path.join(path, MANIFEST))
+        except (OSError, ValueError):
+            return None
+
+        return StoredFractal(FractalGrid(N, bits), selected, manifest)
+
+    def save(self, N, K, origin, grid, selected, metrics=None):
+        """Store a fractal, then evict old entries if over the size cap."""
+        key = self.key(N, K, origin)
+        path = self._path(key)
+        if os.path.isdir(path):
+            if metrics:
+                self.update_metrics(N, K, origin, metrics)
+            return
+
+        # Write into a temporary directory and rename, so readers never see
+        # a partial entry and concurrent writers of the same key are harmless
+        staging = tempfile.mkdtemp(prefix=".staging-", dir=self.root)
+        np.save(os.path.join(staging, "mask.npy"), np.asarray(grid.bits))
+        np.save(os.path.join(staging, "selected.npy"), np.asarray(selected))
+        manifest = {
+            "N": key[0], "count": key[1], "origin": key[2], "version": key[3],
+            "metrics": dict(metrics or {}),
+        }
+        _write_json(os.path.join(staging, MANIFEST), manifest)
+        try:
+            os.rename(staging, path)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+
+        self.evict()
+
+    def update_metrics(self, N, K, origin, metrics):
+        """Merge metrics into a stored entry's manifest."""
+        manifest_path = os.path.join(self._path(self.key(N, K, origin)), MANIFEST)
+        with self._lock:
+            try:
+                with open(manifest_path) as f:
+                    manifest = json.load(f)
+            except (OSError, ValueError):
+                return
+            manifest.setdefault("metrics", {}).update(metrics)
+            _write_json(manifest_path, manifest)
+
+    def entries(self):
+        """(path, size in bytes, last access time) for every stored entry."""
+        found = []
+        for name in os.listdir(self.root):
+            path = os.path.join(self.root, name)
+            manifest_path = os.path.join(path, MANIFEST)
+            if name.startswith(".") or not os.path.isfile(manifest_path):
+                continue
+            size = sum(os.path.getsize(os.path.join(path, f)) for f in os.listdir(path))
+            found.append((path, size, os.path.getmtime(manifest_path)))
+        return found
+
+    def size(self):
+        return sum(size for _, size, _ in self.entries())
+
+    def evict(self):
+        """Remove least recently used entries until the store fits its cap."""
+        with self._lock:
+            entries = sorted(self.entries(), key=lambda e: e[2])
+            total = sum(size for _, size, _ in entries)
+            for path, size, _ in entries:
+                if total <= self.max_bytes:
+                    break
+                shutil.rmtree(path, ignore_errors=True)
+                total -= size
+
+    def clear(self):
+        for path, _, _ in self.entries():
+            shutil.rmtree(path, ignore_errors=True)
+
+    def load_or_build(self, N, K, origin, builder=None):
+        """Stored fractal for (N, K, origin), generating and saving it on a miss."""
+        stored = self.load(N, K, origin)
+        if stored is not None:
+            return stored
+
+        if builder is None:
+            builder = incremental.IncrementalFractal(N, origin)
+        grid = builder.set_K(K)
+        self.save(N, K, origin, grid, builder.selected_points)
+        return self.load(N, K, origin) or StoredFractal(grid, builder.selected_points, {"metrics": {}})
+
+    def dimension(self, N, K, origin, builder=None):
+        """Stored box-counting dimension, computing and recording it on a miss."""
+        stored = self.load_or_build(N, K, origin, builder)
+        if "dimension" not in stored.metrics:
+            dimension = float(metrics.fractal_dimension(stored.grid))
+            self.update_metrics(N, K, origin, {"dimension": dimension})
+            return dimension
+        return stored.metrics["dimension"]
+
+    def prefill(self, N_values, K_values, origins=("corner", "centre")):
+        """Generate and store fractals and dimensions for a grid of parameters."""
+        for origin in origins:
+            for N in N_values:
+                builder = incremental.IncrementalFractal(int(N), origin)
+                for K in sorted(K_values):
+                    self.dimension(int(N), K, origin, builder)
+
+def _load_array(path):
+    """Memory-map a .npy file, falling back to a plain read for empty arrays."""
+    try:
+        return np.load(path, mmap_mode="r")
+    except ValueError:
+        return np.load(path)
+
+def _write_json(path, data):
+    """Atomically replace a JSON file."""
+    tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+_shared = None
+_shared_lock = threading.Lock()
+
+def shared_store():
+    """Process-wide store, or None when FAREY_STORE_DIR is set to an empty string."""
+    global _shared
+    with _shared_lock:
+        if _shared is None:
+            root = os.environ.get("FAREY_STORE_DIR", DEFAULT_ROOT)
+            if not root:
+                return None
+            max_bytes = int(os.environ.get("FAREY_STORE_BYTES", DEFAULT_MAX_BYTES))
+            _shared = FractalStore(root, max_bytes)
+        return _shared
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the on-disk fractal store.")
+    parser.add_argument("--root", default=os.environ.get("FAREY_STORE_DIR") or DEFAULT_ROOT)
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    prefill = commands.add_parser("prefill", help="Precompute fractals for common parameters.")
+    prefill.add_argument("--N", type=int, nargs="+", default=[257])
+    prefill.add_argument("--K", type=float, nargs="+", default=[0.1, 0.2, 0.3, 0.4, 0.5])
+    prefill.add_argument("--origin", nargs="+", default=["corner", "centre"])
+
+    commands.add_parser("info", help="Show the number and size of stored entries.")
+    commands.add_parser("clear", help="Remove every stored entry.")
+
+    args = parser.parse_args(argv)
+    store = FractalStore(args.root)
+
+    if args.command == "prefill":
+        store.prefill(args.N, args.K, args.origin)
+    elif args.command == "clear":
+        store.clear()
+
+    entries = store.entries()
+    print(f"{len(entries)} entries, {sum(s for _, s, _ in entries) / 2**20:.1f} MB in {store.root}")
+
+if __name__ == "__main__":
+    main()
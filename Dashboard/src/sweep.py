@@ -0,0 +1,151 @@
+# -----------------------------------------------------------------------------
+# sweep.py
+# -----------------------------------------------------------------------------
+# Parallel, resumable sweep of fractal dimension over a grid of N and K.
+#
+# Work is grouped by (N, origin): each group builds the Katz index for its N
+# once, from a Farey table shared by every group in the worker, and walks K
+# in increasing order through one incremental builder, so each step only
+# adds the lines that K admits. Groups run in a process pool, and every
+# finished cell is appended to a JSON-lines results file, so an interrupted
+# sweep resumes from the cells already recorded.
+#
+# Usage:
+#   python -m src.sweep --N 50 5000 50 --K 0.1 1.0 0.1 --origin corner centre \
+#       --out sweep.jsonl --workers 8
+#
+# Author: Daniel Cottrell
+# Part of the Farey fractal project.
+# -----------------------------------------------------------------------------
+
+import argparse
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from src import farey, incremental, katz_index, metrics
+from src.store import FractalStore
+
+def cell_key(N, K, origin):
+    """Hashable identity of a sweep cell, robust to float noise in K."""
+    return (int(N), round(float(K), 12), origin.lower())
+
+def load_results(path):
+    """Completed cells of a results file, keyed by cell_key."""
+    results = {}
+    if path is None or not os.path.exists(path):
+        return results
+    with open(path, "rb+") as f:
+        # Terminate a line cut short by an interrupted run, so later
+        # appends start on a fresh line
+        f.seek(0, os.SEEK_END)
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+        f.seek(0)
+        for line in f:
+            try:
+                cell = json.loads(line)
+            except ValueError:
+                continue  # the cut-short line itself
+            results[cell_key(cell["N"], cell["K"], cell["origin"])] = cell
+    return results
+
+def results_matrix(results, N_values, K_values, origin="corner", field="dimension"):
+    """(len(K_values), len(N_values)) matrix of a result field, NaN where missing."""
+    matrix = np.full((len(K_values), len(N_values)), np.nan)
+    for i, K in enumerate(K_values):
+        for j, N in enumerate(N_values):
+            cell = results.get(cell_key(N, K, origin))
+            if cell is not None:
+                matrix[i, j] = cell[field]
+    return matrix
+
+def sweep_group(N, origin, K_values, results_path=None, store_root=None, N_max=None):
+    """Compute every K for one (N, origin), appending each cell as it completes."""
+    store = FractalStore(store_root) if store_root is not None else None
+
+    # One Farey table per worker process serves every N it is given
+    index = katz_index.KatzIndex(N, origin, farey.shared_table(N_max or N))
+    builder = incremental.IncrementalFractal(N, origin, index)
+    cells = []
+    for K in sorted(K_values):
+        if store is not None:
+            dimension = store.dimension(N, K, origin, builder)
+            selected = builder.index.count(K)
+        else:
+            dimension = metrics.fractal_dimension(builder.set_K(K))
+            selected = builder.selected
+
+        cell = {"N": N, "K": float(K), "origin": builder.origin,
+                "dimension": float(dimension), "selected": selected}
+        cells.append(cell)
+        if results_path is not None:
+            _append(results_path, cell)
+    return cells
+
+def run_sweep(N_values, K_values, origins=("corner",), results_path=None,
+              workers=None, store_root=None):
+    """Compute fractal dimensions for every (N, K, origin) not yet in results_path.
+
+    Returns all results (previous and new) keyed by cell_key. With
+    workers=1 the groups run in this process.
+    """
+    results = load_results(results_path)
+
+    groups = []
+    for origin in origins:
+        for N in N_values:
+            pending = [K for K in K_values if cell_key(N, K, origin) not in results]
+            if pending:
+                groups.append((int(N), origin.lower(), pending))
+    # Largest N first, so the longest groups do not start last
+    groups.sort(key=lambda group: -group[0])
+    N_max = groups[0][0] if groups else None
+
+    if workers == 1:
+        completed = (sweep_group(*group, results_path, store_root, N_max) for group in groups)
+        for cells in completed:
+            _collect(results, cells)
+        return results
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(sweep_group, *group, results_path, store_root, N_max) for group in groups]
+        for future in as_completed(futures):
+            _collect(results, future.result())
+    return results
+
+def _collect(results, cells):
+    for cell in cells:
+        results[cell_key(cell["N"], cell["K"], cell["origin"])] = cell
+
+def _append(path, cell):
+    """Append one cell as a single write, so concurrent workers never interleave."""
+    line = (json.dumps(cell) + "\n").encode()
+    fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, line)
+    finally:
+        os.close(fd)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Sweep fractal dimension over N and K.")
+    parser.add_argument("--N", type=int, nargs=3, metavar=("MIN", "MAX", "STEP"), default=[50, 1000, 50])
+    parser.add_argument("--K", type=float, nargs=3, metavar=("MIN", "MAX", "STEP"), default=[0.1, 1.0, 0.1])
+    parser.add_argument("--origin", nargs="+", default=["corner"], choices=["corner", "centre"])
+    parser.add_argument("--out", default="sweep_results.jsonl", help="Results file; existing cells are skipped.")
+    parser.add_argument("--workers", type=int, default=None, help="Worker processes (default: all cores).")
+    parser.add_argument("--store", default=None, help="Optional FractalStore directory to reuse and fill.")
+    args = parser.parse_args(argv)
+
+    N_min, N_max, N_step = args.N
+    K_min, K_max, K_step = args.K
+    N_values = np.arange(N_min, N_max + 1, N_step)
+    K_values = np.arange(K_min, K_max + 1e-9, K_step)
+
+    results = run_sweep(N_values, K_values, args.origin, args.out, args.workers, args.store)
+    print(f"{len(results)} cells in {args.out}")
+
+if __name__ == "__main__":
+    main()
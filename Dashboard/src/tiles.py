@@ -0,0 +1,113 @@
+# -----------------------------------------------------------------------------
+# tiles.py
+# -----------------------------------------------------------------------------
+# Multi-resolution tile pyramid for zooming and panning around large fractals.
+#
+# Level 0 has one pixel per grid cell and every level above halves the
+# resolution, pooling 2 x 2 blocks of the level below, until the whole
+# fractal fits in a single tile. Tiles are pooled straight from the packed
+# occupancy grid when first requested and kept in a small LRU cache, so
+# drawing a view costs work proportional to the viewport, not to N.
+#
+# Author: Daniel Cottrell
+# Part of the Farey fractal project.
+# -----------------------------------------------------------------------------
+
+import numpy as np
+from src import cache
+from src.grid import FractalGrid
+
+TILE_SIZE = 256
+DEFAULT_MAX_BYTES = 64 * 2**20
+
+class TilePyramid:
+    """Lazily pooled tiles of a fractal grid at every zoom level.
+
+    With mode="max" a pixel is set when any cell beneath it is occupied;
+    with mode="count" it holds the number of occupied cells beneath it.
+    """
+
+    def __init__(self, grid, tile_size=TILE_SIZE, mode="max", max_bytes=DEFAULT_MAX_BYTES):
+        if mode not in ("max", "count"):
+            raise ValueError(f"Unknown pooling mode: {mode!r}")
+        if tile_size % 8:
+            raise ValueError("tile_size must be a multiple of 8")
+        self.grid = grid
+        self.N = grid.N
+        self.tile_size = tile_size
+        self.mode = mode
+
+        # Enough levels for the top one to fit in one tile
+        self.levels = 1
+        while self.tile_span(self.levels - 1) < self.N:
+            self.levels += 1
+
+        self._tiles = cache.ResultCache(max_bytes)
+
+    @classmethod
+    def from_points(cls, points, N, **kwargs):
+        """Pyramid of an (M, 2) array of fractal points, e.g. from generate_fractal_points."""
+        return cls(FractalGrid.from_points(points, N), **kwargs)
+
+    @property
+    def nbytes(self):
+        return self.grid.nbytes + self._tiles.bytes
+
+    def factor(self, level):
+        """Cells per pixel side at a level."""
+        return 2 ** level
+
+    def tile_span(self, level):
+        """Cells per tile side at a level."""
+        return self.tile_size * self.factor(level)
+
+    def tile_count(self, level):
+        """Tiles per side at a level."""
+        return -(-self.N // self.tile_span(level))
+
+    def tile(self, level, i, j):
+        """(tile_size, tile_size) tile at a level, indexed [x, y], covering tile row i and column j."""
+        if not (0 <= level < self.levels and 0 <= i < self.tile_count(level) and 0 <= j < self.tile_count(level)):
+            raise IndexError(f"no tile ({level}, {i}, {j})")
+
+        def pool():
+            span = self.tile_span(level)
+            counts = self.grid.block_counts(i * span, j * span, span, self.factor(level))
+            return counts > 0 if self.mode == "max" else counts
+
+        return self._tiles.get_or_compute((level, i, j), pool)
+
+    def level_for(self, width, pixels):
+        """Finest level at which width cells fit in at most pixels pixels."""
+        level = 0
+        while level < self.levels - 1 and width > pixels * self.factor(level):
+            level += 1
+        return level
+
+    def view(self, x0, x1, y0, y1, pixels=1024):
+        """Pooled image of the cells [x0, x1) x [y0, y1) at no more than about pixels per side.
+
+        Returns the image, indexed [x, y], and its extent in cells as
+        (left, right, bottom, top); only the tiles the window touches are
+        pooled.
+        """
+        level = self.level_for(max(x1 - x0, y1 - y0), pixels)
+        f, span, T = self.factor(level), self.tile_span(level), self.tile_size
+        last = self.tile_count(level) - 1
+        i0, i1 = min(max(x0, 0) // span, last), min(max(x1 - 1, 0) // span, last)
+        j0, j1 = min(max(y0, 0) // span, last), min(max(y1 - 1, 0) // span, last)
+
+        image = np.zeros(((i1 - i0 + 1) * T, (j1 - j0 + 1) * T), dtype=bool if self.mode == "max" else np.int64)
+        for i in range(i0, i1 + 1):
+            for j in range(j0, j1 + 1):
+                image[(i - i0) * T:(i - i0 + 1) * T, (j - j0) * T:(j - j0 + 1) * T] = self.tile(level, i, j)
+
+        # Crop to the pixels overlapping the window and the grid
+        px0, px1 = max(x0, 0) // f - i0 * T, -(-min(x1, self.N) // f) - i0 * T
+        py0, py1 = max(y0, 0) // f - j0 * T, -(-min(y1, self.N) // f) - j0 * T
+        image = image[px0:px1, py0:py1]
+        left, bottom = (px0 + i0 * T) * f, (py0 + j0 * T) * f
+        return image, (left, left + image.shape[0] * f, bottom, bottom + image.shape[1] * f)
+
+    def stats(self):
+        return self._tiles.stats()
@@ -9,28 +9,75 @@
 # -----------------------------------------------------------------------------
 
 import numpy as np
+from src import backends, farey
+
+# Sign patterns used to reflect a point into all four quadrants
+REFLECTIONS = np.array([(1, 1), (1, -1), (-1, 1), (-1, -1)], dtype=np.int64)
 
 def farey_to_grid(sequence):
     """Map Farey fractions (a/b) to coordinates (b, a)."""
-    return [(frac.denominator, frac.numerator) for frac in sequence]
+    if isinstance(sequence, np.ndarray):
+        # (a, b) integer rows, as produced by farey.farey_array
+        return sequence[:, ::-1].copy()
+    coords = [(frac.denominator, frac.numerator) for frac in sequence]
+    return np.array(coords, dtype=np.int64).reshape(-1, 2)
 
 def generate_full_plane(grid_points, N):
     """Reflect and mirror points across axes to cover all quadrants."""
-    full_points = []
     center = N // 2  # middle of the square
 
-    for (b, a) in grid_points:
-        # generate reflections
-        variants = [(b, a), (b, -a), (-b, a), (-b, -a)]
-        for x, y in variants:
-            # shift so origin maps to the middle of the square
-            new_x = (x + center) % N
-            new_y = (y + center) % N
-            full_points.append((new_x, new_y))
-
-    return full_points
+    # generate reflections, then shift so origin maps to the middle of the square
+    return backends.current().mirror_plane(grid_points, REFLECTIONS, N, center)
 
 def sort_points_by_distance(points):
     """Sort points by Euclidean distance from origin."""
-    return sorted(points, key=lambda x: np.sqrt(x[0]**2 + x[1]**2))
+    pts = np.asarray(points).reshape(-1, 2)
+    sqd = (pts.astype(np.int64) ** 2).sum(axis=1)
+    return pts[np.argsort(sqd, kind="stable")]
+
+def plane_max_coordinate(N):
+    """Largest coordinate produced by generate_full_plane for a Farey grid."""
+    # Every denominator 1 .. N occurs, so the shifted reflections (center ± b) % N
+    # reach every residue, including N - 1
+    return N - 1
+
+def generate_katz_plane(N, K):
+    """Generate only the mirrored Farey points kept by the Katz criterion.
+
+    Equivalent to generate_full_plane -> sort_points_by_distance ->
+    criteria.apply_katz_criterion, but candidates are enumerated from the
+    residues inside the Katz radius, so the cost scales with the points kept.
+    """
+    threshold = np.float64(plane_max_coordinate(N)) * K
+    limit = threshold**2
+    center = N // 2
+
+    # Largest integer coordinate that can still satisfy x^2 <= limit
+    radius = N - 1
+    if limit < radius**2:
+        radius = int(np.sqrt(limit))
+        while (radius + 1)**2 <= limit:
+            radius += 1
+        while radius**2 > limit:
+            radius -= 1
+    residues = np.arange(radius + 1, dtype=np.int64)
+
+    points, order = [], []
+    for variant, (sx, sy) in enumerate(REFLECTIONS):
+        # Denominators b in 1 .. N whose reflected x coordinate is a residue
+        # within the radius; sx is its own inverse modulo N
+        denominators = (sx * (residues - center) - 1) % N + 1
+        terms, positions = farey.farey_terms_by_denominator(denominators, N)
+
+        x = (sx * terms[:, 1] + center) % N
+        y = (sy * terms[:, 0] + center) % N
+        keep = x**2 + y**2 <= limit
+        points.append(np.stack((x[keep], y[keep]), axis=1))
+        order.append(positions[keep] * len(REFLECTIONS) + variant)
+
+    points = np.concatenate(points)
+    order = np.concatenate(order)
 
+    # Match the ordering of the full chain: by distance, then generation order
+    sqd = points[:, 0]**2 + points[:, 1]**2
+    return points[np.lexsort((order, sqd))]